@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+import argparse
+import platform
+import sys
+from collections import OrderedDict
+from django_returnfields.app import App  # shorthand
+
+app = App()
+app.setup(apps=["bench"], root_urlconf="bench.urls", extra_settings={"DEBUG": False})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark for restriction and aggressive optimization")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--select", nargs="*", default=None, help="run only scenarios including the substring")
+    parser.add_argument("--output", default=None, help="storing results as json (e.g. baseline.json)")
+    parser.add_argument("--compare", default=None, help="comparing with stored json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed requests/sec regression ratio")
+    args = parser.parse_args(argv)
+
+    import django
+    from django.db.models import Model
+    from django.test.client import Client
+    from bench import models, setup_db, runner
+
+    for v in vars(models).values():
+        if isinstance(v, type) and issubclass(v, Model):
+            app.create_table(v)
+    setup_db.setup(n=max(args.rows))
+
+    results = runner.run(Client(), args.rows, args.repeat, selected=args.select)
+    meta = OrderedDict([
+        ("python", platform.python_version()),
+        ("django", django.get_version()),
+        ("rows", args.rows),
+        ("repeat", args.repeat),
+    ])
+    if args.output:
+        runner.dump(args.output, results, meta)
+
+    if args.compare:
+        lines, regressed = runner.compare(results, runner.load(args.compare), threshold=args.threshold)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+
+    for name, r in results.items():
+        if "error" in r:
+            print("{:<60} {}".format(name, r["error"]))
+            continue
+        print("{:<60} {:>10} req/s {:>10} KB {:>4} queries".format(
+            name, r["requests_per_sec"], r["peak_alloc_kb"], r["query_count"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# -*- coding:utf-8 -*-
+from django.db import models
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=255)
+    email = models.CharField(max_length=255, default="", blank=True)
+
+    class Meta:
+        db_table = "author"
+
+
+class Blog(models.Model):
+    title = models.CharField(max_length=255)
+    description = models.TextField(default="", blank=True)
+
+    class Meta:
+        db_table = "blog"
+
+
+class Article(models.Model):
+    title = models.CharField(max_length=255)
+    content = models.TextField(default="", blank=True)
+    blog = models.ForeignKey(Blog, related_name="articles")
+    author = models.ForeignKey(Author, related_name="articles")
+
+    class Meta:
+        db_table = "article"
+
+
+class Comment(models.Model):
+    title = models.CharField(max_length=255)
+    content = models.TextField(default="", blank=True)
+    article = models.ForeignKey(Article, related_name="comments")
+
+    class Meta:
+        db_table = "comment"
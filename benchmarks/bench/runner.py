@@ -0,0 +1,128 @@
+# -*- coding:utf-8 -*-
+import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from django_returnfields import instrumentation
+
+ENDPOINTS = [
+    # (name, depth, path)
+    ("comments", 1, "/comments/"),
+    ("articles", 2, "/articles/"),
+    ("blogs", 3, "/blogs/"),
+]
+
+PARAMS = [
+    ("plain", ""),
+    ("include", "return_fields=id,title"),
+    ("include_nested", "return_fields=id,title,articles__title,comments__title,author__name"),
+    ("exclude", "skip_fields=content,description,articles__content,comments__content"),
+    ("aggressive", "aggressive=1"),
+    ("include_aggressive", "return_fields=id,title,articles__title,comments__title,author__name&aggressive=1"),
+    ("exclude_aggressive", "skip_fields=content,description,articles__content,comments__content&aggressive=1"),
+]
+
+
+class Scenario(object):
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+
+    @classmethod
+    def collect(cls, rows_list):
+        for endpoint, depth, path in ENDPOINTS:
+            for rows in rows_list:
+                for param_name, params in PARAMS:
+                    name = "list/{}/depth={}/rows={}/{}".format(endpoint, depth, rows, param_name)
+                    yield cls(name, "{}?limit={}&{}".format(path, rows, params).rstrip("&"))
+            for param_name, params in PARAMS:
+                name = "detail/{}/depth={}/{}".format(endpoint, depth, param_name)
+                yield cls(name, "{}1/?{}".format(path, params).rstrip("?"))
+
+
+def measure_queries(client, path):
+    metrics = instrumentation.activate()
+    recorder = instrumentation.QueryRecorder(metrics)
+    recorder.start()
+    try:
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+    finally:
+        recorder.stop()
+        instrumentation.deactivate()
+    return metrics
+
+
+def measure_allocations(client, path):
+    tracemalloc.start()
+    try:
+        client.get(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure_throughput(client, path, repeat):
+    st = time.perf_counter()
+    for i in range(repeat):
+        client.get(path)
+    elapsed = time.perf_counter() - st
+    return repeat / elapsed
+
+
+def run(client, rows_list, repeat, warmup=3, selected=None):
+    results = OrderedDict()
+    for scenario in Scenario.collect(rows_list):
+        if selected and not any(s in scenario.name for s in selected):
+            continue
+        try:
+            for i in range(warmup):
+                client.get(scenario.path)
+            metrics = measure_queries(client, scenario.path)
+        except Exception as e:
+            results[scenario.name] = OrderedDict([("path", scenario.path), ("error", repr(e))])
+            continue
+        results[scenario.name] = OrderedDict([
+            ("path", scenario.path),
+            ("requests_per_sec", round(measure_throughput(client, scenario.path, repeat), 2)),
+            ("peak_alloc_kb", round(measure_allocations(client, scenario.path) / 1024.0, 2)),
+            ("query_count", metrics.query_count),
+        ])
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """returns (lines, regressed)"""
+    lines = []
+    regressed = False
+    fmt = "{:<60} {:>10} {:>10} {:>8} {:>8} {:>8}"
+    lines.append(fmt.format("scenario", "rps", "base", "ratio", "queries", "base"))
+    for name, r in results.items():
+        b = baseline.get(name)
+        if "error" in r:
+            regressed = regressed or (b is not None and "error" not in b)
+            lines.append(fmt.format(name, "error", "-", "-", "-", "-"))
+            continue
+        if b is None or "error" in b:
+            lines.append(fmt.format(name, r["requests_per_sec"], "-", "-", r["query_count"], "-"))
+            continue
+        ratio = r["requests_per_sec"] / b["requests_per_sec"]
+        mark = ""
+        if r["query_count"] > b["query_count"] or ratio < 1 - threshold:
+            regressed = True
+            mark = " !"
+        lines.append(fmt.format(name, r["requests_per_sec"], b["requests_per_sec"], "{:.2f}".format(ratio),
+                                r["query_count"], b["query_count"]) + mark)
+    return lines, regressed
+
+
+def load(path):
+    with open(path) as rf:
+        return json.load(rf, object_pairs_hook=OrderedDict)["results"]
+
+
+def dump(path, results, meta):
+    with open(path, "w") as wf:
+        json.dump(OrderedDict([("meta", meta), ("results", results)]), wf, indent=2)
+        wf.write("\n")
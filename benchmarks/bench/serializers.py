@@ -0,0 +1,40 @@
+# -*- coding:utf-8 -*-
+from rest_framework import serializers
+from django_returnfields import serializer_factory
+from . import models
+
+
+# depth=1
+@serializer_factory
+class CommentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Comment
+        fields = ("id", "title", "content", "article")
+
+
+@serializer_factory
+class AuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Author
+        fields = ("id", "name", "email")
+
+
+# depth=2
+@serializer_factory
+class ArticleSerializer(serializers.ModelSerializer):
+    author = AuthorSerializer()
+    comments = CommentSerializer(many=True)
+
+    class Meta:
+        model = models.Article
+        fields = ("id", "title", "content", "author", "comments")
+
+
+# depth=3
+@serializer_factory
+class BlogSerializer(serializers.ModelSerializer):
+    articles = ArticleSerializer(many=True)
+
+    class Meta:
+        model = models.Blog
+        fields = ("id", "title", "description", "articles")
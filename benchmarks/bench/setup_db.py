@@ -0,0 +1,19 @@
+# -*- coding:utf-8 -*-
+
+
+def setup(n=100, per_parent=3):
+    from .models import Author, Blog, Article, Comment
+    Author.objects.bulk_create([Author(name="author{}".format(i), email="author{}@example.com".format(i)) for i in range(n)])
+    Blog.objects.bulk_create([Blog(title="blog{}".format(i), description="x" * 100) for i in range(n)])
+    authors = list(Author.objects.all().order_by("id"))
+    articles = []
+    for i, blog in enumerate(Blog.objects.all().order_by("id")):
+        for j in range(per_parent):
+            author = authors[(i + j) % len(authors)]
+            articles.append(Article(title="article{}-{}".format(i, j), content="y" * 200, blog=blog, author=author))
+    Article.objects.bulk_create(articles)
+    comments = []
+    for article in Article.objects.all().order_by("id"):
+        for k in range(per_parent):
+            comments.append(Comment(title="comment{}".format(k), content="z" * 100, article=article))
+    Comment.objects.bulk_create(comments)
@@ -0,0 +1,13 @@
+# -*- coding:utf-8 -*-
+from django.conf.urls import url, include
+from rest_framework import routers
+from . import viewsets
+
+router = routers.DefaultRouter()
+router.register(r'comments', viewsets.CommentViewSet)
+router.register(r'articles', viewsets.ArticleViewSet)
+router.register(r'blogs', viewsets.BlogViewSet)
+
+urlpatterns = [
+    url(r'^', include(router.urls))
+]
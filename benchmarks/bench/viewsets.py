@@ -0,0 +1,29 @@
+# -*- coding:utf-8 -*-
+from rest_framework import viewsets
+from . import models
+from . import serializers
+
+
+class LimitedMixin(object):
+    # ?limit=<n>, for changing the number of rows
+    def get_queryset(self):
+        qs = super(LimitedMixin, self).get_queryset()
+        limit = self.request.GET.get("limit")
+        if limit:
+            qs = qs.filter(id__lte=int(limit))
+        return qs
+
+
+class CommentViewSet(LimitedMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = models.Comment.objects.all()
+    serializer_class = serializers.CommentSerializer
+
+
+class ArticleViewSet(LimitedMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = models.Article.objects.all()
+    serializer_class = serializers.ArticleSerializer
+
+
+class BlogViewSet(LimitedMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = models.Blog.objects.all()
+    serializer_class = serializers.BlogSerializer
@@ -1,50 +1,100 @@
 # -*- coding:utf-8 -*-
 import logging
 import warnings
+import weakref
 from collections import OrderedDict
 from .constants import ALL
+from . import instrumentation
+from .conf import returnfields_settings as _settings, get_view_option, resolve, DEFAULTS, FROM_SETTINGS
+from .aggressive import iterate_chunks, OptimizedList, OptimizedInstance
 from .optimize import QueryOptimizer
+from .rendering import FlatRowRenderer
+from .selection import FieldSelection, Frame
+from .selection import truncate_for_child  # NOQA
+from .structures import LRUCache, ClassRegistry
 from .optimize import contextual, depends  # NOQA
 
 logger = logging.getLogger(__name__)
+default_app_config = "django_returnfields.apps.ReturnFieldsConfig"
 
-# TODO: see settings
-INCLUDE_KEY = "return_fields"
-EXCLUDE_KEY = "skip_fields"
-PATH_KEY = "_drf__path"  # {name: string, return_fields: string[], skip_fields: string[]}[]
+# defaults, see: conf.py (RETURNFIELDS in settings)
+INCLUDE_KEY = DEFAULTS["INCLUDE_KEY"]
+EXCLUDE_KEY = DEFAULTS["EXCLUDE_KEY"]
+PATH_KEY = "_drf__path"  # Frame[]
 INACTIVE_KEY = "_drf__inactive"
-AGGRESSIVE_KEY = "_drf__aggressive"  # boolean
-
-
-def truncate_for_child(fields, prefix, field_name):
-    if field_name is None:
-        return fields
-    if len(fields) == 1 and fields[0] == ALL:
-        return fields
-    r = []
-    for s in fields:
-        if s.startswith(prefix):
-            r.append(s[len(prefix):])
-        elif s == field_name:
-            r.append(ALL)
-    return r
+AGGRESSIVE_CONTEXT_KEY = "_drf__aggressive"  # boolean
+AGGRESSIVE_KEY = AGGRESSIVE_CONTEXT_KEY  # deprecated alias, not RETURNFIELDS["AGGRESSIVE_KEY"] (the query parameter)
+PARSED_KEY = "_drf__parsed"  # {<include key or exclude key>: string[]}
+FIELDS_CACHE_SIZE = DEFAULTS["FIELDS_CACHE_SIZE"]
+SERIALIZER_CACHE_SIZE = DEFAULTS["SERIALIZER_CACHE_SIZE"]
+STREAMING_CHUNK_SIZE = DEFAULTS["STREAMING_CHUNK_SIZE"]
 
 
 def is_already_upgraded(cls):
     return hasattr(cls, "to_restricted_fields")
 
 
+def has_dynamic_fields(serializer_class):
+    # get_fields() is overridden by the serializer (not by rest_framework's classes)
+    for cls in serializer_class.__mro__:
+        if cls.__module__.startswith("rest_framework."):
+            return False
+        if "get_fields" in vars(cls):
+            return True
+    return False
+
+
 class RequestValue(object):
     # default is request.GET
+    # the options are request-time, FROM_SETTINGS is resolved for each request.
+    # limits of return_fields/skip_fields (None is unlimited)
+    def __init__(self, max_fields=FROM_SETTINGS, max_depth=FROM_SETTINGS, max_length=FROM_SETTINGS,
+                 aggressive_key=FROM_SETTINGS, aggressive=FROM_SETTINGS):
+        self.max_fields = max_fields
+        self.max_depth = max_depth
+        self.max_length = max_length
+        self.aggressive_key = aggressive_key
+        self.aggressive = aggressive  # default, if the request doesn't have ?aggressive=1
+
     def get(self, context):
         return context["request"].GET
 
     def parse(self, context, key):
-        fields_names_string = self.get(context).get(key, "")
-        return [field_name.strip() for field_name in fields_names_string.split(",") if field_name]
+        # parsed once per request (context)
+        parsed = context.get(PARSED_KEY)
+        if parsed is None:
+            parsed = context[PARSED_KEY] = {}
+        names = parsed.get(key)
+        if names is None:
+            view = context.get("view")
+            names = parsed[key] = self._parse(
+                self.get(context).get(key, ""), key,
+                max_fields=get_view_option(view, "MAX_FIELDS", resolve(self.max_fields, "MAX_FIELDS")),
+                max_depth=get_view_option(view, "MAX_DEPTH", resolve(self.max_depth, "MAX_DEPTH")),
+                max_length=get_view_option(view, "MAX_LENGTH", resolve(self.max_length, "MAX_LENGTH")),
+            )
+        return names
+
+    def _parse(self, fields_names_string, key, max_fields=None, max_depth=None, max_length=None):
+        from .exceptions import InvalidSelection
+        if max_length is not None and len(fields_names_string) > max_length:
+            raise InvalidSelection("{}: too long (max length is {})".format(key, max_length))
+        names = tuple(field_name.strip() for field_name in fields_names_string.split(",") if field_name.strip())
+        if max_fields is not None and len(names) > max_fields:
+            raise InvalidSelection("{}: too many fields (max is {})".format(key, max_fields))
+        if max_depth is not None:
+            for name in names:
+                if name.count("__") >= max_depth:
+                    raise InvalidSelection("{}: {} is too deep (max depth is {})".format(key, name, max_depth))
+        return names
 
     def can_optimize(self, context):
-        return self.get(context).get("aggressive", False)
+        if AGGRESSIVE_CONTEXT_KEY not in context:
+            context[AGGRESSIVE_CONTEXT_KEY] = (
+                bool(self.get(context).get(resolve(self.aggressive_key, "AGGRESSIVE_KEY"), False)) or
+                bool(get_view_option(context.get("view"), "AGGRESSIVE", resolve(self.aggressive, "AGGRESSIVE")))
+            )
+        return context[AGGRESSIVE_CONTEXT_KEY]
 
     def is_active(self, context, restriction, reloaded=False):
         if PATH_KEY in context:
@@ -80,8 +130,11 @@ class FrameManagement(object):
         # print("{}<<< {}".format(" " * len(context[PATH_KEY]), frame))
         return frame
 
+    def depth(self, context):
+        return len(context[PATH_KEY])
+
     def is_toplevel(self, context):
-        return context[PATH_KEY][-1].get("toplevel", False)
+        return context[PATH_KEY][-1].toplevel
 
     def has_frame(self, context):
         return PATH_KEY in context
@@ -92,19 +145,28 @@ class FrameManagement(object):
 
 class Restriction(object):
     def __init__(self, request_value, frame_management, query_optimizer_cls,
-                 include_key=INCLUDE_KEY, exclude_key=EXCLUDE_KEY):
+                 include_key=FROM_SETTINGS, exclude_key=FROM_SETTINGS, fields_cache_size=FROM_SETTINGS,
+                 flat_rendering=False, plan_cache_size=FROM_SETTINGS, values_evaluation=False):
         self.request_value = request_value
         self.frame_management = frame_management
-        self.query_optimizer = query_optimizer_cls(self)
-        self.include_key = include_key
-        self.exclude_key = exclude_key
+        self.query_optimizer = query_optimizer_cls(
+            self, plan_cache_size=plan_cache_size, values_evaluation=values_evaluation
+        )
+        self.include_key = resolve(include_key, "INCLUDE_KEY")
+        self.exclude_key = resolve(exclude_key, "EXCLUDE_KEY")
         self.active_check_keys = (self.include_key, self.exclude_key)
+        # (<Serializer class>, <FieldSelection key>) -> field names
+        self.fields_cache = LRUCache(maxsize=resolve(fields_cache_size, "FIELDS_CACHE_SIZE"))
+        # (<Serializer class>, <FieldSelection key>) -> layout of FlatRowRenderer (or False, if not flat)
+        self.flat_layouts_cache = LRUCache(maxsize=resolve(fields_cache_size, "FIELDS_CACHE_SIZE"))
+        self.flat_rendering = flat_rendering
 
     def setup(self, context, many=False):
         if self.frame_management.has_frame(context):
             return self.frame_management.is_toplevel(context)
-        frame = self._make_initial_frame(context)
-        self.frame_management.init_frame(context, frame)
+        with instrumentation.measure(instrumentation.SETUP):
+            frame = self._make_initial_frame(context)
+            self.frame_management.init_frame(context, frame)
         return True
 
     def is_active(self, context):
@@ -113,11 +175,59 @@ class Restriction(object):
     def can_optimize(self, context):
         return self.request_value.can_optimize(context)
 
+    def canonical_selection(self, context):
+        # order and duplication of names are ignored, e.g. "name,id,id" == "id,name"
+        return (
+            (self.include_key, tuple(sorted(set(self.request_value.parse(context, self.include_key))))),
+            (self.exclude_key, tuple(sorted(set(self.request_value.parse(context, self.exclude_key))))),
+        )
+
     def to_restricted_fields(self, serializer, fields):
+        metrics = instrumentation.current_metrics()
+        if metrics is None:
+            return self._to_restricted_fields(serializer, fields)
+        with instrumentation.measure(instrumentation.RESTRICTION, metrics):
+            return self._to_restricted_fields(serializer, fields)
+
+    def _to_restricted_fields(self, serializer, fields):
         frame = self.frame_management.current_frame(serializer.context)
-        return self._make_new_fields(frame, fields)
+        selection = frame.selection
+        if selection.include_all and not selection.excluded_names:
+            return fields
+        k = (serializer.__class__, selection.key)
+        if serializer._returnfields_dynamic_fields:
+            # get_fields() is overridden, the fields can be changed per request (e.g. by permissions)
+            k = k + (tuple(fields), )
+        names = self.fields_cache.get(k)
+        if names is None:
+            new_fields = self._make_new_fields(frame, fields)
+            self.fields_cache.set(k, tuple(new_fields.keys()))
+            return new_fields
+        return OrderedDict((name, fields[name]) for name in names)
+
+    def get_flat_renderer(self, serializer):
+        if serializer._returnfields_dynamic_fields:
+            return FlatRowRenderer.from_serializer(serializer)
+        frame = self.frame_management.current_frame(serializer.context)
+        k = (serializer.__class__, frame.selection.key)
+        layout = self.flat_layouts_cache.get(k)
+        if layout is None:
+            layout = FlatRowRenderer.compile(serializer) or False
+            self.flat_layouts_cache.set(k, layout)
+        return FlatRowRenderer.bind(serializer, layout or None)
 
     def to_representation(self, serializer, data):
+        if self.frame_management.depth(serializer.context) > 1:
+            return self._to_representation(serializer, data)
+        metrics = instrumentation.current_metrics()
+        if metrics is None:
+            return self._to_representation(serializer, data)
+        with instrumentation.measure(instrumentation.SERIALIZATION, metrics):
+            ret = self._to_representation(serializer, data)
+        instrumentation.count_rows(len(ret) if isinstance(ret, list) else 1)
+        return ret
+
+    def _to_representation(self, serializer, data):
         field_name = serializer.field_name
         frame = self.frame_management.current_frame(serializer.context)
         new_frame = self._make_new_frame(frame, field_name)
@@ -126,48 +236,46 @@ class Restriction(object):
         self.frame_management.pop_frame(serializer.context)
         return ret
 
+    def iter_representation(self, serializer, chunks):
+        field_name = serializer.field_name
+        frame = self.frame_management.current_frame(serializer.context)
+        new_frame = self._make_new_frame(frame, field_name)
+        self.frame_management.push_frame(serializer.context, new_frame)
+        try:
+            for chunk in chunks:
+                for row in serializer._to_representation(chunk):
+                    yield row
+        finally:
+            self.frame_management.pop_frame(serializer.context)
+
     def _make_initial_frame(self, context):
-        frame = {
-            "name": "",
-            "toplevel": True,
-            self.include_key: self.request_value.parse(context, self.include_key),
-            self.exclude_key: self.request_value.parse(context, self.exclude_key),
-        }
+        includes = self.request_value.parse(context, self.include_key)
+        excludes = self.request_value.parse(context, self.exclude_key)
         try:
-            logger.debug("restriction: start with %s", frame)
+            logger.debug("restriction: start with %s=%s, %s=%s", self.include_key, includes, self.exclude_key, excludes)
         except Exception:
             logger.warn("unexpected arguments: %s", self.request_value.get(context), exc_info=True)
-        if not frame[self.include_key]:
-            frame[self.include_key] = [ALL]
-        return frame
+        if not includes:
+            includes = [ALL]
+        return Frame("", FieldSelection.compile(includes, excludes), toplevel=True)
 
     def _make_new_fields(self, frame, fields):
-        return_fields = frame[self.include_key]
-        if ALL in return_fields:
+        selection = frame.selection
+        if selection.include_all:
             new_fields = fields
         else:
             # include filter
             new_fields = OrderedDict()
-            relations = [field_name.split("__", 2)[0] for field_name in return_fields]
             for k in fields.keys():
-                if k in return_fields or k in relations:
+                if k in selection.included_names:
                     new_fields[k] = fields[k]
         # exclude filter
-        for k in frame[self.exclude_key]:
+        for k in selection.excluded_names:
             new_fields.pop(k, None)
         return new_fields
 
     def _make_new_frame(self, frame, field_name):
-        prefix = "{}__".format(field_name)
-        new_frame = {
-            "name": field_name,
-            self.include_key: truncate_for_child(frame[self.include_key], prefix, field_name),
-            self.exclude_key: truncate_for_child(frame[self.exclude_key], prefix, field_name)
-        }
-        return new_frame
-
-    def __hash__(self):
-        return hash((self.__class__, self.include_key, self.exclude_key))
+        return frame.child(field_name)
 
 
 class ForceAggressiveRestriction(Restriction):
@@ -178,37 +286,140 @@ class ForceAggressiveRestriction(Restriction):
         return True
 
 
-def restriction_factory(restriction_class=Restriction, **kwargs):
-    return restriction_class(RequestValue(), FrameManagement(), QueryOptimizer, **kwargs)
+def restriction_factory(restriction_class=Restriction, request_value=None, **kwargs):
+    return restriction_class(request_value or RequestValue(), FrameManagement(), QueryOptimizer, **kwargs)
 
 
-_cache = {}
-_default_restriction = restriction_factory(include_key=INCLUDE_KEY, exclude_key=EXCLUDE_KEY)
+_registry = ClassRegistry(maxsize=lambda: _settings.SERIALIZER_CACHE_SIZE)
+_default_restrictions = []  # created on first use, after django's settings are configured
 
 
-def serializer_factory(serializer_class, restriction=_default_restriction):
-    from rest_framework.serializers import ListSerializer
+def get_default_restriction():
+    with _registry.lock:
+        if not _default_restrictions:
+            _default_restrictions.append(restriction_factory())
+        return _default_restrictions[0]
+
+
+_pending_upgrades = []  # upgrade functions of lazily created serializers
+
+
+def _registry_key(serializer_class, many, restriction):
+    # restriction is compared by identity, classes are not kept alive by the key
+    return (weakref.ref(serializer_class), many, weakref.ref(restriction))
+
+
+def clear_registry():
+    """forgetting all wrapped serializer classes (e.g. for each test)"""
+    _registry.clear()
+
+
+def registry_info():
+    return _registry.info()
+
+
+def warmup():
+    """upgrading all lazily created serializers, explicitly"""
+    with _registry.lock:
+        pending = _pending_upgrades[:]
+        del _pending_upgrades[:]
+    for upgrade in pending:
+        upgrade()
+    return len(pending)
 
-    k = (serializer_class, False, restriction.__hash__())
-    if k in _cache:
-        return _cache[k]
+
+def precompile():
+    """building translator mappings of all wrapped serializers, eagerly (e.g. at startup, before forking workers)"""
+    classes = [cls for cls in _registry.values() if hasattr(cls, "precompile")]
+    for cls in classes:
+        cls.precompile()
+    return len(classes)
+
+
+def serializer_factory(serializer_class, restriction=None, lazy=False):
+    """
+    if lazy=True, creating the list serializer class and upgrading nested serializers are
+    deferred until first instantiation (or `warmup()`).
+    """
+    restriction = restriction or get_default_restriction()
+    k = _registry_key(serializer_class, False, restriction)
+    with _registry.lock:
+        cls = _registry.get(k)
+        if cls is None:
+            cls = _registry.set(k, _serializer_factory(serializer_class, restriction, lazy))
+        return cls
+
+
+def _serializer_factory(serializer_class, restriction, lazy):
+    from rest_framework.serializers import ListSerializer
     if is_already_upgraded(serializer_class):
-        _cache[k] = serializer_class
         return serializer_class
 
+    state = {"upgraded": False}
+
+    def upgrade():
+        if state["upgraded"]:
+            return
+        with _registry.lock:
+            if state["upgraded"]:
+                return
+            ReturnFieldsSerializer.Meta.list_serializer_class = list_serializer_factory(
+                getattr(getattr(serializer_class, 'Meta', object),
+                        'list_serializer_class',
+                        ListSerializer),
+                restriction=restriction)
+            upgrade_member_classes(serializer_class, restriction)
+            state["upgraded"] = True
+
     class ReturnFieldsSerializer(serializer_class):
+        _returnfields_dynamic_fields = has_dynamic_fields(serializer_class)
+
         # override
         def __init__(self, instance=None, *args, **kwargs):
+            if not state["upgraded"]:
+                upgrade()
             context = kwargs.get("context")
-            if context and instance is not None and "_many" not in context and restriction.is_active(context):
+            if isinstance(instance, OptimizedInstance):
+                instance = instance.instance
+            elif context and instance is not None and "_many" not in context and restriction.is_active(context):
                 restriction.setup(context, many=False)
                 if restriction.can_optimize(context):
                     instance = restriction.query_optimizer.optimize_query(context, instance, self.__class__)
-                    instance = instance.to_queryset().first()
+                    if hasattr(instance, "to_queryset"):  # not replayed plan
+                        instance = instance.to_queryset()
+                    instance = instance.first()
             super(ReturnFieldsSerializer, self).__init__(instance, *args, **kwargs)
 
+        @classmethod
+        def optimize_queryset(cls, queryset, context):
+            if not restriction.is_active(context):
+                return None
+            restriction.setup(context, many=True)
+            if not restriction.can_optimize(context):
+                return None
+            return restriction.query_optimizer.optimize_queryset(context, queryset, cls)
+
+        @classmethod
+        def describe_selection(cls, context):
+            if not restriction.is_active(context):
+                return None
+            restriction.setup(context, many=True)
+            return restriction.query_optimizer.describe(context, cls)
+
+        @classmethod
+        def precompile(cls):
+            restriction.query_optimizer.translator.compile(cls)
+
+        @classmethod
+        def canonical_selection(cls, context):
+            if not restriction.is_active(context):
+                return None
+            return restriction.canonical_selection(context)
+
         @classmethod
         def many_init(cls, *args, **kwargs):
+            if not state["upgraded"]:
+                upgrade()
             context = kwargs.get("context")
             if context:
                 context["_many"] = True
@@ -240,11 +451,7 @@ def serializer_factory(serializer_class, restriction=_default_restriction):
                 return fields
 
         class Meta(getattr(serializer_class, 'Meta', object)):
-            list_serializer_class = list_serializer_factory(
-                getattr(getattr(serializer_class, 'Meta', object),
-                        'list_serializer_class',
-                        ListSerializer),
-                restriction=restriction)
+            pass  # list_serializer_class is set by upgrade()
 
     ReturnFieldsSerializer.__name__ = "ReturnFields{}".format(serializer_class.__name__)
     try:
@@ -252,18 +459,28 @@ def serializer_factory(serializer_class, restriction=_default_restriction):
     except AttributeError as e:
         warnings.warn(str(e), UserWarning)  # for python2.x
 
-    _cache[k] = ReturnFieldsSerializer
-    upgrade_member_classes(serializer_class, restriction)
+    if lazy:
+        _pending_upgrades.append(upgrade)
+    else:
+        _registry.set(_registry_key(serializer_class, False, restriction), ReturnFieldsSerializer)  # for recursive definition
+        upgrade()
     return ReturnFieldsSerializer
 
 
-def list_serializer_factory(serializer_class, restriction=_default_restriction):
-    k = (serializer_class, True, restriction.__hash__())
-    if k in _cache:
-        return _cache[k]
+def list_serializer_factory(serializer_class, restriction=None):
+    restriction = restriction or get_default_restriction()
+    k = _registry_key(serializer_class, True, restriction)
+    with _registry.lock:
+        cls = _registry.get(k)
+        if cls is None:
+            cls = _registry.set(k, _list_serializer_factory(serializer_class, restriction))
+        return cls
+
+
+def _list_serializer_factory(serializer_class, restriction):
     if is_already_upgraded(serializer_class):
-        _cache[k] = serializer_class
         return serializer_class
+    from .fields import annotate_aggregates  # importing rest_framework.serializers needs django's settings
 
     class ReturnFieldsListSerializer(serializer_class):
         # override
@@ -272,7 +489,7 @@ def list_serializer_factory(serializer_class, restriction=_default_restriction):
             if context and restriction.is_active(context):
                 child = kwargs["child"]
                 restriction.setup(context, many=True)
-                if restriction.can_optimize(context):
+                if restriction.can_optimize(context) and not isinstance(instance, OptimizedList):
                     instance = restriction.query_optimizer.optimize_query(context, instance, child.__class__)
             super(ReturnFieldsListSerializer, self).__init__(instance, *args, **kwargs)
 
@@ -285,8 +502,26 @@ def list_serializer_factory(serializer_class, restriction=_default_restriction):
             return restriction.to_representation(self, data)
 
         def _to_representation(self, data):
+            data = annotate_aggregates(self.child, data)
+            if restriction.flat_rendering or restriction.query_optimizer.can_evaluate_values(self.context):
+                renderer = restriction.get_flat_renderer(self.child)
+                if renderer is not None:
+                    return renderer.render(data)
             return super(ReturnFieldsListSerializer, self).to_representation(data)
 
+        def iter_representation(self, data, chunk_size=None):
+            chunks = iterate_chunks(data, chunk_size or _settings.STREAMING_CHUNK_SIZE)
+            if not restriction.is_active(self.context):
+                return self._iter_representation(chunks)
+            elif not restriction.setup(self.context, many=True) and not self.field_name:
+                return self._iter_representation(chunks)
+            return restriction.iter_representation(self, chunks)
+
+        def _iter_representation(self, chunks):
+            for chunk in chunks:
+                for row in super(ReturnFieldsListSerializer, self).to_representation(chunk):
+                    yield row
+
         def to_restricted_fields(self, fields):
             raise Exception("dont't use this")
 
@@ -295,7 +530,6 @@ def list_serializer_factory(serializer_class, restriction=_default_restriction):
         ReturnFieldsListSerializer.__doc__ = serializer_class.__doc__
     except AttributeError as e:
         warnings.warn(str(e), UserWarning)  # for python2.x
-    _cache[k] = ReturnFieldsListSerializer
     return ReturnFieldsListSerializer
 
 
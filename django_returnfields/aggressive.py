@@ -1,20 +1,200 @@
 import logging
-from django_aggressivequery import from_queryset
+from itertools import chain
+import django_aggressivequery as aq
 
 
 logger = logging.getLogger(__name__)
 
 
-def aggressive_query(qs, name_list, skip_list=None):
+def aggressive_query(qs, name_list, skip_list=None, select_related=()):
     assert qs.model
-    aqs = from_queryset(qs, name_list, more_specific=True)
+    qs = qs.all()
+    transaction = aq.ExtractorTransaction(qs, name_list)
+    optimizer = NestedPrefetchOptimizer(
+        transaction, enable_selections=True, extensions=make_extensions(), select_related=select_related
+    )
+    aqs = aq.AggressiveQuery(qs, optimizer)
     if skip_list:
         aqs = aqs.skip_filter(skip_list)
     return aqs
 
 
+def make_extensions():
+    # not sharing aq.default_extension_repository, prefetch_filter() mutates the registered extension
+    from django_aggressivequery import extensions as ex
+    return (
+        ex.ExtensionRepository()
+        .register(ex.PrefetchFilterExtension())
+        .register(ex.SkipFieldsExtension())
+        .register(ex.CustomPrefetchExtension())
+    )
+
+
+class NestedPrefetchOptimizer(aq.QueryOptimizer):
+    """
+    building a Prefetch object per nesting level, e.g. Prefetch("articles", Article.objects.only(...).prefetch_related(Prefetch("comments", ...))).
+    each prefetch queryset has only() for the selected fields and the fk column for joining.
+    """
+
+    def __init__(self, transaction, enable_selections=True, extensions=None, select_related=()):
+        super(NestedPrefetchOptimizer, self).__init__(transaction, enable_selections=enable_selections, extensions=extensions)
+        self.select_related = select_related  # single-valued relations, always joined
+
+    def __copy__(self):
+        new = super(NestedPrefetchOptimizer, self).__copy__()
+        new.select_related = self.select_related
+        return new
+
+    def optimize(self, qs, result=None):
+        qs = self._optimize(qs.all(), result or self.result)
+        if self.select_related:
+            qs = drop_joined_prefetches(qs.select_related(*self.select_related), self.select_related)
+        return qs
+
+    def _optimize(self, qs, result, path=None, externals=None):
+        # path is the lookup from the toplevel queryset, for prefetch_filter()
+        joins = list(self.collect_lazy_join_list_recursive(result))
+        prefetches = []
+        for lazy_join in joins:
+            prefetches.extend(self._collect_prefetches(lazy_join.result, prefix=lazy_join.name))
+        prefetches.extend(self._collect_prefetches(result))
+
+        qs = aq.reset_select_related(qs, [lazy_join() for lazy_join in joins])
+        qs = aq.reset_prefetch_related(qs, [self._build_prefetch(lazy_prefetch, path) for lazy_prefetch in prefetches])
+        return self._optimize_selections(qs, result, externals=externals)
+
+    def _collect_prefetches(self, result, prefix=None):
+        for h, sr in self.inspector.collect_prefetch_list(result):
+            lazy_prefetch = aq.LazyPrefetch(h.name, h, sr)
+            yield lazy_prefetch.prefixed(prefix) if prefix is not None else lazy_prefetch
+
+    def _optimize_selections(self, qs, result, name=None, externals=None):
+        # a selected fk without subfields (e.g. PrimaryKeyRelatedField) is not in collect_selections(),
+        # keeping its column, otherwise it is loaded lazily per row
+        fks = [h.name for h in collect_forward_fks(qs.model, result)]
+        return super(NestedPrefetchOptimizer, self)._optimize_selections(
+            qs, result, name=name, externals=list(externals or []) + fks
+        )
+
+    def _build_prefetch(self, lazy_prefetch, path):
+        hint = lazy_prefetch.hint
+        fullpath = lazy_prefetch.name if path is None else "{}__{}".format(path, lazy_prefetch.name)
+        externals = None
+        if hasattr(hint, "type") and hint.type == ":prefetch":  # custom_prefetch()
+            prefetch_qs, to_attr = hint.value.queryset, hint.name
+            lazy_prefetch.name = lazy_prefetch.name.replace(hint.name, hint.value.prefetch_through)
+        else:
+            prefetch_qs, to_attr = hint.rel_model.objects.all(), None
+            if hint.rel_fk:
+                externals = [hint.rel_fk]
+        for extension in self.extensions.with_type(":prefetch"):
+            prefetch_qs = extension.apply(prefetch_qs, fullpath)
+        prefetch_qs = self._optimize(prefetch_qs, lazy_prefetch.result, path=fullpath, externals=externals)
+        return lazy_prefetch(prefetch_qs, to_attr=to_attr)
+
+
+def collect_forward_fks(model, result):
+    fields = {f.name: f for f in model._meta.concrete_fields if f.is_relation}
+    joined = {sr.name for sr in result.subresults}
+    for h in chain(result.related, result.reverse_related):
+        if h.name in fields and h.name not in joined:
+            yield fields[h.name]
+
+
+def drop_joined_prefetches(qs, select_related):
+    """removing prefetch lookups of joined paths, their nested lookups are prefetched from the joined objects"""
+    from django.db.models import Prefetch
+
+    joined = set()
+    for path in select_related:
+        names = path.split("__")
+        joined.update("__".join(names[:i]) for i in range(1, len(names) + 1))
+
+    lookups = []
+    seen = set()
+    pending = list(qs._prefetch_related_lookups)
+    while pending:
+        lookup = pending.pop(0)
+        to = getattr(lookup, "prefetch_to", lookup)
+        if to in seen:
+            continue
+        seen.add(to)
+        if to not in joined:
+            lookups.append(lookup)
+            continue
+        nested = getattr(lookup, "queryset", None)
+        for x in (nested._prefetch_related_lookups if nested is not None else ()):
+            if isinstance(x, Prefetch):
+                pending.append(Prefetch("{}__{}".format(to, x.prefetch_through), queryset=x.queryset, to_attr=x.to_attr))
+            else:
+                pending.append("{}__{}".format(to, x))
+    if not joined.intersection(seen):
+        return qs
+    return qs.prefetch_related(None).prefetch_related(*lookups)
+
+
+def map_prefetch(qs, path, fn):
+    """applying fn to the queryset of the Prefetch object at the path (e.g. "articles__comments"), or None if not found"""
+    from django.db.models import Prefetch
+
+    lookups = list(qs._prefetch_related_lookups)
+    for i, lookup in enumerate(lookups):
+        if not isinstance(lookup, Prefetch) or lookup.queryset is None:
+            continue
+        if path == lookup.prefetch_to:
+            sub_qs = fn(lookup.queryset)
+        elif path.startswith(lookup.prefetch_to + "__"):
+            sub_qs = map_prefetch(lookup.queryset, path[len(lookup.prefetch_to) + 2:], fn)
+        else:
+            continue
+        if sub_qs is None:
+            return None
+        lookups[i] = Prefetch(lookup.prefetch_through, queryset=sub_qs, to_attr=lookup.to_attr)
+        return qs.prefetch_related(None).prefetch_related(*lookups)
+    return None
+
+
+def merge_prefetch(qs, lookups):
+    """
+    adding lookups, deduplicated by the prefetch_to of the lookups already in qs.
+    a lookup already prefetched (by the optimization) is skipped, the optimized one is kept as is.
+    a Prefetch object with a queryset cannot be merged (e.g. its filter changes the nested serializer's data),
+    so ImproperlyConfigured is raised, use Prefetch(..., to_attr=<name>) for it.
+    """
+    from django.core.exceptions import ImproperlyConfigured
+
+    merged = list(qs._prefetch_related_lookups)
+    known = {getattr(x, "prefetch_to", x) for x in merged}
+    for lookup in lookups:
+        to = getattr(lookup, "prefetch_to", lookup)
+        if to not in known:
+            merged.append(lookup)
+            known.add(to)
+        elif getattr(lookup, "queryset", None) is not None:
+            raise ImproperlyConfigured(
+                "{} is already prefetched by the optimization, use Prefetch({!r}, queryset=..., to_attr=<name>)".format(
+                    to, lookup.prefetch_through
+                )
+            )
+    return qs.prefetch_related(None).prefetch_related(*merged)
+
+
+class OptimizedList(list):
+    """objects fetched with an already optimized query (e.g. a paginated page)"""
+
+
+class OptimizedInstance(object):
+    """an object fetched with an already optimized query (e.g. by AggressiveRetrieveMixin), not fetched again"""
+    __slots__ = ("instance", )
+
+    def __init__(self, instance):
+        self.instance = instance
+
+
 def revive_query(query_or_extraction):
-    if hasattr(query_or_extraction, "query"):
+    if isinstance(query_or_extraction, OptimizedList):
+        return query_or_extraction, False
+    elif hasattr(query_or_extraction, "query"):
         return query_or_extraction, True
     elif isinstance(query_or_extraction, (list, tuple)) and not len(query_or_extraction) == 0:
         pks = [x.pk for x in query_or_extraction]
@@ -29,3 +209,100 @@ def revive_query(query_or_extraction):
             logger.warning("unsupported type. ignored", exc_info=True)
     else:
         return query_or_extraction, False
+
+
+def iterate_chunks(query_or_extraction, chunk_size):
+    """yielding list of objects, prefetching is applied per chunk"""
+    from django.db.models import Manager, prefetch_related_objects
+
+    qs = query_or_extraction
+    if hasattr(type(qs), "to_queryset"):  # AggressiveQuery
+        qs = qs.to_queryset()
+    elif isinstance(qs, Manager):
+        qs = qs.all()
+
+    if not hasattr(qs, "iterator") or qs._result_cache is not None:
+        objects = list(qs)
+        for i in range(0, len(objects), chunk_size):
+            yield objects[i:i + chunk_size]
+        return
+
+    lookups = qs._prefetch_related_lookups
+    qs = qs.prefetch_related(None)
+    try:
+        iterator = qs.iterator(chunk_size=chunk_size)
+    except TypeError:  # django < 2.0
+        iterator = qs.iterator()
+
+    chunk = []
+    for ob in iterator:
+        chunk.append(ob)
+        if len(chunk) >= chunk_size:
+            prefetch_related_objects(chunk, *lookups)
+            yield chunk
+            chunk = []
+    if chunk:
+        prefetch_related_objects(chunk, *lookups)
+        yield chunk
+
+
+def clone_prefetch(lookup):
+    from django.db.models import Prefetch
+
+    if not isinstance(lookup, Prefetch):
+        return lookup
+    qs = lookup.queryset
+    if qs is not None:
+        sub_lookups = [clone_prefetch(x) for x in qs._prefetch_related_lookups]
+        qs = qs.prefetch_related(None)
+        if sub_lookups:
+            qs = qs.prefetch_related(*sub_lookups)
+    return Prefetch(lookup.prefetch_through, queryset=qs, to_attr=lookup.to_attr)
+
+
+def iterate_select_related(d, prefix=""):
+    # {"user": {"profile": {}}} -> ["user__profile"]
+    for name, sub in d.items():
+        fullname = "{}{}".format(prefix, name)
+        if sub:
+            for subname in iterate_select_related(sub, prefix="{}__".format(fullname)):
+                yield subname
+        else:
+            yield fullname
+
+
+class QueryPlan(object):
+    """only/defer, select_related, prefetch_related of an optimized queryset, for replaying"""
+
+    def __init__(self, deferred_loading, select_related, prefetch_lookups):
+        self.deferred_loading = deferred_loading
+        self.select_related = select_related
+        self.prefetch_lookups = prefetch_lookups
+
+    @classmethod
+    def from_queryset(cls, qs):
+        names, defer = qs.query.deferred_loading
+        select_related = qs.query.select_related
+        if isinstance(select_related, dict):
+            select_related = list(iterate_select_related(select_related))
+        return cls(
+            deferred_loading=(tuple(sorted(names)), defer),
+            select_related=select_related,
+            prefetch_lookups=[clone_prefetch(x) for x in qs._prefetch_related_lookups],
+        )
+
+    def replay(self, qs):
+        qs = qs.select_related(None)
+        if self.select_related is True:
+            qs = qs.select_related()
+        elif self.select_related:
+            qs = qs.select_related(*self.select_related)
+
+        qs = qs.prefetch_related(None)
+        if self.prefetch_lookups:
+            qs = qs.prefetch_related(*[clone_prefetch(x) for x in self.prefetch_lookups])
+
+        names, defer = self.deferred_loading
+        if names:
+            qs = qs.defer(*names) if defer else qs.only(*names)
+        return qs
@@ -0,0 +1,34 @@
+# -*- coding:utf-8 -*-
+from django.apps import AppConfig
+
+
+class ReturnFieldsConfig(AppConfig):
+    name = "django_returnfields"
+    verbose_name = "django returnfields"
+
+    def ready(self):
+        from .conf import returnfields_settings
+        if returnfields_settings.PRECOMPILE:
+            precompile_urlconf()
+        if returnfields_settings.CONNECT_RESPONSE_CACHES:
+            connect_urlconf_response_caches()
+
+
+def precompile_urlconf():
+    try:
+        from django.urls import get_resolver
+    except ImportError:  # django < 1.10
+        from django.core.urlresolvers import get_resolver
+    from . import warmup, precompile
+    # importing views (and serializers) via urlconf
+    get_resolver().url_patterns
+    warmup()
+    return precompile()
+
+
+def connect_urlconf_response_caches():
+    from django.conf import settings
+    from .caching import connect_response_caches
+    if not getattr(settings, "ROOT_URLCONF", None):
+        return []
+    return connect_response_caches()
@@ -0,0 +1,275 @@
+# -*- coding:utf-8 -*-
+import hashlib
+import logging
+from django.core.cache import caches
+from django.db.models import signals
+from django.http import Http404
+from rest_framework.response import Response
+from .aggressive import OptimizedList, OptimizedInstance
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "returnfields"
+_connected = set()  # (<model>, <cache alias>)
+
+
+def get_version_key(model):
+    return "{}:version:{}".format(KEY_PREFIX, model._meta.label_lower)
+
+
+def bump_version(cache, model):
+    k = get_version_key(model)
+    try:
+        cache.incr(k)
+    except ValueError:  # not found
+        if not cache.add(k, 1, None):
+            cache.incr(k)
+
+
+def connect_invalidation(model, alias="default"):
+    """invalidating cached responses on post_save/post_delete of the model"""
+    if (model, alias) in _connected:
+        return
+    _connected.add((model, alias))
+
+    def invalidate(sender, **kwargs):
+        bump_version(caches[alias], sender)
+
+    uid = "{}:invalidate:{}:{}".format(KEY_PREFIX, model._meta.label_lower, alias)
+    signals.post_save.connect(invalidate, sender=model, weak=False, dispatch_uid=uid)
+    signals.post_delete.connect(invalidate, sender=model, weak=False, dispatch_uid=uid)
+
+
+def iterate_view_classes(patterns):
+    """view classes in the urlconf (e.g. get_resolver().url_patterns)"""
+    for pattern in patterns:
+        if hasattr(pattern, "url_patterns"):  # include()
+            for cls in iterate_view_classes(pattern.url_patterns):
+                yield cls
+        else:
+            cls = getattr(getattr(pattern, "callback", None), "cls", None)
+            if cls is not None:
+                yield cls
+
+
+def connect_response_caches(view_classes=None):
+    """
+    connecting invalidation of views using ResponseCacheMixin (default is the views in the urlconf), eagerly.
+    otherwise it is connected on the first cached read, and writes before that (e.g. in another process) are missed.
+    """
+    if view_classes is None:
+        try:
+            from django.urls import get_resolver
+        except ImportError:  # django < 1.10
+            from django.core.urlresolvers import get_resolver
+        view_classes = iterate_view_classes(get_resolver().url_patterns)
+
+    connected = []
+    for cls in view_classes:
+        if not issubclass(cls, ResponseCacheMixin) or cls in connected:
+            continue
+        try:
+            models = cls().get_response_cache_models()
+        except Exception:  # e.g. get_queryset() depending on the request
+            logger.warning("cannot connect invalidation of %r at startup, connected on first read", cls, exc_info=True)
+            continue
+        for model in models:
+            connect_invalidation(model, alias=cls.response_cache_alias)
+        connected.append(cls)
+    return connected
+
+
+def iterate_serializer_models(serializer_class):
+    """models of the serializer and its nested serializers"""
+    from .optimize import default_translator
+    model = getattr(getattr(serializer_class, "Meta", None), "model", None)
+    if model is not None:
+        yield model
+    for field in default_translator.get_fields(serializer_class).values():
+        field = getattr(field, "child", field)
+        if hasattr(field, "_declared_fields"):
+            for model in iterate_serializer_models(field.__class__):
+                yield model
+
+
+class ResponseCacheMixin(object):
+    """
+    caching serialized payload of list/retrieve, keyed by (view, action, url kwargs, query params, selection, user).
+    the selection is canonicalized, so `return_fields=id,name` and `return_fields=name,id,id` share the entry.
+
+    on retrieve, the object is looked up (and check_object_permissions is called) even if the response is cached.
+    the cache is invalidated on post_save/post_delete of the models of the serializer (and nested serializers).
+    the other changes (e.g. many-to-many add/remove, the related rows of annotations) are not concerned,
+    so list such models in `response_cache_models`.
+    the signals are connected at startup for views in the urlconf (see connect_response_caches()).
+    """
+    response_cache_alias = "default"
+    response_cache_timeout = 60
+    response_cache_models = None  # models for invalidation, default is (queryset.model, <models of nested serializers>)
+
+    def list(self, request, *args, **kwargs):
+        parent = super(ResponseCacheMixin, self).list
+        return self.cached_response("list", lambda: parent(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super(ResponseCacheMixin, self).retrieve
+        self.get_object()  # 404 or 403, before serving the cached response
+        return self.cached_response("retrieve", lambda: parent(request, *args, **kwargs))
+
+    def get_response_cache(self):
+        return caches[self.response_cache_alias]
+
+    def get_response_cache_models(self):
+        if self.response_cache_models:
+            return self.response_cache_models
+        models = [self.get_queryset().model]
+        for model in iterate_serializer_models(self.get_serializer_class()):
+            if model not in models:
+                models.append(model)
+        return tuple(models)
+
+    def get_response_cache_key_extra(self):
+        # responses can be depending on the user, override this if these are shared
+        return (getattr(self.request.user, "pk", None), )
+
+    def get_response_cache_key(self, action, models):
+        cache = self.get_response_cache()
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+
+        selection = None
+        if hasattr(serializer_class, "canonical_selection"):
+            selection = serializer_class.canonical_selection(context)
+        selection_keys = [k for k, _ in selection or ()]
+        params = sorted(
+            (k, v) for k, vs in self.request.query_params.lists() for v in vs if k not in selection_keys
+        )
+        version_keys = [get_version_key(model) for model in models]
+        versions = cache.get_many(version_keys)
+        source = repr((
+            self.__class__.__module__, self.__class__.__name__, action,
+            sorted(self.kwargs.items()), params, selection,
+            [versions.get(k, 0) for k in version_keys],
+            self.get_response_cache_key_extra(),
+        ))
+        return "{}:response:{}".format(KEY_PREFIX, hashlib.md5(source.encode("utf-8")).hexdigest())
+
+    def cached_response(self, action, get_response):
+        models = self.get_response_cache_models()
+        for model in models:
+            connect_invalidation(model, alias=self.response_cache_alias)
+
+        cache = self.get_response_cache()
+        k = self.get_response_cache_key(action, models)
+        data = cache.get(k)
+        if data is not None:
+            logger.debug("response cache hit: %s", k)
+            return Response(data)
+
+        response = get_response()
+        if response.status_code == 200:
+            cache.set(k, response.data, self.response_cache_timeout)
+        return response
+
+
+def update_digest(h, ob, ancestors=()):
+    """hashing loaded (not deferred) column values, also select_related and prefetch_related objects"""
+    from django.db.models import Model
+    if isinstance(ob, Model):
+        h.update("<{}>".format(ob._meta.label_lower).encode("utf-8"))
+        if ob in ancestors:  # e.g. skill.user, set by prefetching user.skills
+            h.update(repr(ob.pk).encode("utf-8"))
+            return h
+        ancestors = ancestors + (ob, )
+        for k in sorted(ob.__dict__.keys()):
+            v = ob.__dict__[k]
+            if k == "_state":
+                # django >= 2.0, select_related objects are stored in _state.fields_cache
+                fields_cache = getattr(v, "fields_cache", None) or {}
+                for name in sorted(fields_cache.keys()):
+                    h.update(name.encode("utf-8"))
+                    update_digest(h, fields_cache[name], ancestors)
+            elif k == "_prefetched_objects_cache":
+                for name in sorted(v.keys()):
+                    h.update(name.encode("utf-8"))
+                    update_digest(h, list(v[name]), ancestors)
+            elif isinstance(v, Model):  # select_related
+                h.update(k.encode("utf-8"))
+                update_digest(h, v, ancestors)
+            elif not k.startswith("_"):
+                h.update("{}={!r};".format(k, v).encode("utf-8"))
+    elif isinstance(ob, (list, tuple)):
+        h.update("[{}]".format(len(ob)).encode("utf-8"))
+        for x in ob:
+            update_digest(h, x, ancestors)
+    else:
+        h.update(repr(ob).encode("utf-8"))
+    return h
+
+
+def parse_if_none_match(value):
+    return [etag.strip().replace("W/", "", 1) for etag in value.split(",") if etag.strip()]
+
+
+class ConditionalGetMixin(object):
+    """
+    ETag for list/retrieve, derived from the values of the selected columns.
+    the objects are fetched with the aggressively optimized query (only(), prefetch_related()),
+    and if the ETag is matched with If-None-Match, 304 is returned without serialization.
+    (if the query cannot be optimized, e.g. without `aggressive=1`, this mixin does nothing)
+    """
+
+    def list(self, request, *args, **kwargs):
+        optimized = self.get_optimized_queryset(self.filter_queryset(self.get_queryset()))
+        if optimized is None:
+            return super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+
+        page = self.paginate_queryset(optimized)
+        objects = OptimizedList(optimized if page is None else page)
+        extra = None if page is None else self.get_paginated_response([]).data  # count, links
+        etag = self.get_etag(objects, extra)
+        if etag in parse_if_none_match(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            return self.not_modified(etag)
+
+        data = self.get_serializer(objects, many=True).data
+        response = Response(data) if page is None else self.get_paginated_response(data)
+        response["ETag"] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        qs = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        optimized = self.get_optimized_queryset(qs)
+        if optimized is None:
+            return super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+
+        objects = OptimizedList(optimized[:1])
+        if not objects:
+            raise Http404
+        self.check_object_permissions(request, objects[0])
+        etag = self.get_etag(objects)
+        if etag in parse_if_none_match(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            return self.not_modified(etag)
+
+        response = Response(self.get_serializer(OptimizedInstance(objects[0])).data)
+        response["ETag"] = etag
+        return response
+
+    def get_optimized_queryset(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, "optimize_queryset"):
+            return None
+        return serializer_class.optimize_queryset(queryset, self.get_serializer_context())
+
+    def get_etag(self, objects, extra=None):
+        serializer_class = self.get_serializer_class()
+        selection = serializer_class.canonical_selection(self.get_serializer_context())
+        h = hashlib.sha1()
+        h.update(repr((serializer_class.__module__, serializer_class.__name__, selection, extra)).encode("utf-8"))
+        update_digest(h, objects)
+        return '"{}"'.format(h.hexdigest())
+
+    def not_modified(self, etag):
+        response = Response(status=304)
+        response["ETag"] = etag
+        return response
@@ -0,0 +1,121 @@
+# -*- coding:utf-8 -*-
+"""
+settings, read lazily on first access (and reloaded on setting_changed, e.g. override_settings).
+
+e.g. (settings.py)
+RETURNFIELDS = {"AGGRESSIVE": True, "PLAN_CACHE_SIZE": 128}
+
+and per-view overrides (only request-time options, see VIEW_OPTIONS)
+class UserViewSet(viewsets.ModelViewSet):
+    returnfields_settings = {"AGGRESSIVE": False, "MAX_FIELDS": 20}
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+
+SETTINGS_NAME = "RETURNFIELDS"
+VIEW_SETTINGS_ATTRIBUTE_NAME = "returnfields_settings"
+
+DEFAULTS = {
+    "INCLUDE_KEY": "return_fields",
+    "EXCLUDE_KEY": "skip_fields",
+    "AGGRESSIVE_KEY": "aggressive",
+    "AGGRESSIVE": False,  # optimizing without ?aggressive=1
+    "FIELDS_CACHE_SIZE": 256,
+    "SERIALIZER_CACHE_SIZE": 256,
+    "PLAN_CACHE_SIZE": 0,  # disabled
+    "PLAN_CACHEABLE": True,
+    "STREAMING_CHUNK_SIZE": 1000,
+    "MAX_FIELDS": 256,
+    "MAX_DEPTH": 10,
+    "MAX_LENGTH": 4096,
+    "INSTRUMENTATION_SINKS": None,  # dotted paths or callables, default is [LoggingSink()]
+    "EXPLAIN_KEY": "explain",  # ?explain=1, only if settings.DEBUG (see diagnostics.py)
+    "PRECOMPILE": False,  # building translator mappings of all serializers in the urlconf, at startup
+    "CONNECT_RESPONSE_CACHES": True,  # connecting invalidation of ResponseCacheMixin views in the urlconf, at startup
+}
+VIEW_OPTIONS = ("AGGRESSIVE", "PLAN_CACHEABLE", "STREAMING_CHUNK_SIZE", "MAX_FIELDS", "MAX_DEPTH", "MAX_LENGTH")
+
+
+class Settings(object):
+    def __init__(self, options):
+        self.__dict__.update(options)
+
+    def __repr__(self):
+        return "<{} {!r}>".format(self.__class__.__name__, self.__dict__)
+
+
+class FromSettings(object):
+    """default argument, the value of RETURNFIELDS is used"""
+
+    def __repr__(self):
+        return "<from settings>"
+
+
+FROM_SETTINGS = FromSettings()
+
+
+def load_settings(options=None):
+    if options is None:
+        from django.conf import settings
+        options = getattr(settings, SETTINGS_NAME, None) or {}
+    unknown = set(options).difference(DEFAULTS)
+    if unknown:
+        raise ImproperlyConfigured("{}: unknown keys {}".format(SETTINGS_NAME, sorted(unknown)))
+    d = DEFAULTS.copy()
+    d.update(options)
+    return Settings(d)
+
+
+def get_view_option(view, name, default):
+    overrides = getattr(view, VIEW_SETTINGS_ATTRIBUTE_NAME, None)
+    if not overrides:
+        return default
+    return overrides.get(name, default)
+
+
+def get_sinks(settings):
+    from django.utils.module_loading import import_string
+    if settings.INSTRUMENTATION_SINKS is None:
+        return None
+    sinks = []
+    for sink in settings.INSTRUMENTATION_SINKS:
+        if isinstance(sink, str):
+            sink = import_string(sink)
+        sinks.append(sink() if isinstance(sink, type) else sink)
+    return sinks
+
+
+class LazySettings(object):
+    def __init__(self):
+        self._wrapped = None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        wrapped = self._wrapped
+        if wrapped is None:
+            from django.conf import settings
+            try:
+                options = getattr(settings, SETTINGS_NAME, None) or {}
+            except ImproperlyConfigured:  # django's settings are not configured yet, defaults are not cached
+                return getattr(load_settings({}), name)
+            wrapped = self._wrapped = load_settings(options)
+        return getattr(wrapped, name)
+
+    def reload(self):
+        self._wrapped = None
+
+
+returnfields_settings = LazySettings()
+
+
+def resolve(value, name):
+    return getattr(returnfields_settings, name) if value is FROM_SETTINGS else value
+
+
+def _on_setting_changed(setting, **kwargs):
+    if setting == SETTINGS_NAME:
+        returnfields_settings.reload()
+
+
+setting_changed.connect(_on_setting_changed)
@@ -0,0 +1,115 @@
+# -*- coding:utf-8 -*-
+"""
+explaining the optimized query of a selection, for tuning.
+(translated name list, the plan of the optimized queryset, emitted SQL with timings, and EXPLAIN output)
+"""
+from collections import OrderedDict
+from django.db import connections
+from rest_framework.response import Response
+from .aggressive import OptimizedList
+from .conf import returnfields_settings as _settings
+
+
+def explain_sql(qs):
+    if hasattr(qs, "explain"):  # django >= 2.1
+        return qs.explain()
+    connection = connections[qs.db]
+    sql, params = qs.query.sql_with_params()
+    prefix = "EXPLAIN QUERY PLAN" if connection.vendor == "sqlite" else "EXPLAIN"
+    with connection.cursor() as cursor:
+        cursor.execute("{} {}".format(prefix, sql), params)
+        return "\n".join(" ".join(str(x) for x in row) for row in cursor.fetchall())
+
+
+def describe_queryset(qs, lookup=""):
+    """only/defer, select_related, annotations and prefetch_related of the queryset (and nested prefetch querysets)"""
+    from .aggressive import iterate_select_related
+    names, defer = qs.query.deferred_loading
+    select_related = qs.query.select_related
+    if isinstance(select_related, dict):
+        select_related = list(iterate_select_related(select_related))
+    d = OrderedDict([
+        ("lookup", lookup),
+        ("model", qs.model._meta.label),
+        ("defer" if defer else "only", sorted(names)),
+        ("select_related", select_related),
+        ("annotations", sorted(qs.query.annotations)),
+        ("prefetch_related", []),
+    ])
+    for x in qs._prefetch_related_lookups:
+        if getattr(x, "queryset", None) is not None:
+            d["prefetch_related"].append(describe_queryset(x.queryset, lookup=x.prefetch_to))
+        else:
+            d["prefetch_related"].append(getattr(x, "prefetch_to", x))
+    return d
+
+
+def iterate_querysets(qs, lookup=""):
+    yield lookup, qs
+    for x in qs._prefetch_related_lookups:
+        if getattr(x, "queryset", None) is not None:
+            fullname = x.prefetch_to if not lookup else "{}__{}".format(lookup, x.prefetch_to)
+            for pair in iterate_querysets(x.queryset, lookup=fullname):
+                yield pair
+
+
+def explain(serializer_class, queryset, context, many=True):
+    """
+    serializing with the optimized queryset, and collecting the diagnostics.
+    (prefetch querysets are explained without the `IN (...)` condition added at fetching)
+    """
+    from django.test.utils import CaptureQueriesContext
+    optimized = None
+    selection = None
+    if hasattr(serializer_class, "optimize_queryset"):
+        optimized = serializer_class.optimize_queryset(queryset, context)
+        selection = serializer_class.describe_selection(context)
+    qs = queryset if optimized is None else optimized
+    if not many:
+        qs = qs[:1]
+
+    with CaptureQueriesContext(connections[qs.db]) as captured:
+        objects = OptimizedList(qs)
+        data = serializer_class(objects, many=True, context=context).data
+
+    return OrderedDict([
+        ("optimized", optimized is not None),
+        ("selection", selection),
+        ("plan", describe_queryset(qs)),
+        ("queries", [OrderedDict([("sql", q["sql"]), ("time", float(q["time"]))]) for q in captured.captured_queries]),
+        ("explain", [
+            OrderedDict([("lookup", lookup), ("sql", str(sub_qs.query)), ("plan", explain_sql(sub_qs))])
+            for lookup, sub_qs in iterate_querysets(qs)
+        ]),
+        ("count", len(data)),
+    ])
+
+
+class ExplainMixin(object):
+    """
+    `?explain=1` returns the diagnostics of list/retrieve instead of the response.
+    enabled only if settings.DEBUG (or override `is_explain_enabled()`).
+    """
+    explain_key = None  # default is RETURNFIELDS["EXPLAIN_KEY"]
+
+    def list(self, request, *args, **kwargs):
+        if not self.should_explain(request):
+            return super(ExplainMixin, self).list(request, *args, **kwargs)
+        return self.explain_response(self.filter_queryset(self.get_queryset()), many=True)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.should_explain(request):
+            return super(ExplainMixin, self).retrieve(request, *args, **kwargs)
+        ob = self.get_object()  # 404 or 403, as retrieve
+        qs = self.filter_queryset(self.get_queryset()).filter(pk=ob.pk)
+        return self.explain_response(qs, many=False)
+
+    def is_explain_enabled(self, request):
+        from django.conf import settings
+        return settings.DEBUG
+
+    def should_explain(self, request):
+        return bool(request.query_params.get(self.explain_key or _settings.EXPLAIN_KEY)) and self.is_explain_enabled(request)
+
+    def explain_response(self, queryset, many):
+        return Response(explain(self.get_serializer_class(), queryset, self.get_serializer_context(), many=many))
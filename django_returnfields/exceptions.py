@@ -0,0 +1,7 @@
+# -*- coding:utf-8 -*-
+# imported on demand, rest_framework.exceptions requires configured settings
+from rest_framework.exceptions import ParseError
+
+
+class InvalidSelection(ParseError):
+    default_detail = "return_fields/skip_fields is too large."
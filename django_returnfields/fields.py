@@ -0,0 +1,51 @@
+# -*- coding:utf-8 -*-
+from rest_framework import serializers
+from .optimize import check_aggregate
+
+
+class AggregateField(serializers.ReadOnlyField):
+    """
+    field backed by a database aggregate, e.g. comment_count = AggregateField(Count("comments", distinct=True)).
+    if the field is selected, the optimized queryset is annotated (named by the source) instead of prefetching the relation.
+    """
+
+    def __init__(self, aggregate, **kwargs):
+        check_aggregate(self.__class__.__name__, aggregate)
+        self.aggregate = aggregate
+        super(AggregateField, self).__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        if hasattr(instance, "_meta") and not hasattr(instance, self.source):
+            # not annotated (e.g. without aggressive=1, a single object), aggregated for the object.
+            # lists are aggregated by one query, see annotate_aggregates()
+            qs = instance.__class__._default_manager.filter(pk=instance.pk)
+            return qs.annotate(_aggregated=self.aggregate).values_list("_aggregated", flat=True).first()
+        return super(AggregateField, self).get_attribute(instance)
+
+
+def annotate_aggregates(serializer, objects):
+    """
+    setting the values of selected AggregateFields not annotated (e.g. without aggressive=1), by one query for the objects.
+    returns the objects (a list, if the queryset or the manager is evaluated)
+    """
+    from django.db.models import Manager
+    fields = [f for f in serializer.fields.values() if isinstance(f, AggregateField)]
+    if not fields:
+        return objects
+    objects = list(objects.all() if isinstance(objects, Manager) else objects)
+    if not objects or not hasattr(objects[0], "_meta"):
+        return objects
+    fields = [f for f in fields if not hasattr(objects[0], f.source)]
+    if not fields:
+        return objects
+
+    model = objects[0].__class__
+    names = ["_aggregated_{}".format(i) for i in range(len(fields))]
+    qs = model._default_manager.filter(pk__in=[ob.pk for ob in objects])
+    qs = qs.annotate(**{name: f.aggregate for name, f in zip(names, fields)})
+    rows = {row[0]: row[1:] for row in qs.values_list("pk", *names)}
+    for ob in objects:
+        values = rows.get(ob.pk, (None, ) * len(fields))
+        for i, f in enumerate(fields):
+            setattr(ob, f.source, values[i])
+    return objects
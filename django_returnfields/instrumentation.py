@@ -0,0 +1,204 @@
+# -*- coding:utf-8 -*-
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+
+logger = logging.getLogger(__name__)
+
+SETUP = "setup"  # parsing and compiling return_fields/skip_fields
+RESTRICTION = "restriction"  # filtering fields of serializers
+OPTIMIZATION = "optimization"  # building aggressive query
+SQL = "sql"
+SERIALIZATION = "serialization"  # excluding nested restriction and sql
+PHASES = (SETUP, RESTRICTION, OPTIMIZATION, SQL, SERIALIZATION)
+
+_local = threading.local()
+
+
+class Metrics(object):
+    """the timings are exclusive, time spent in a nested phase is not counted by the outer phase"""
+
+    def __init__(self):
+        self.timings = OrderedDict((phase, 0.0) for phase in PHASES)
+        self.query_count = 0
+        self.rows = 0
+        self.stack = []  # [<start>, <elapsed of nested phases>][]
+
+    def add(self, phase, elapsed):
+        self.timings[phase] = self.timings.get(phase, 0.0) + elapsed
+        if self.stack:
+            self.stack[-1][1] += elapsed
+
+    def enter(self):
+        self.stack.append([time.time(), 0.0])
+
+    def exit(self, phase):
+        start, nested = self.stack.pop()
+        elapsed = time.time() - start
+        self.add(phase, elapsed - nested)
+        if self.stack:
+            self.stack[-1][1] += nested
+
+    def asdict(self):
+        d = OrderedDict(self.timings)
+        d["query_count"] = self.query_count
+        d["rows"] = self.rows
+        return d
+
+
+def current_metrics():
+    return getattr(_local, "metrics", None)
+
+
+def activate(metrics=None):
+    _local.metrics = metrics or Metrics()
+    return _local.metrics
+
+
+def deactivate():
+    metrics = current_metrics()
+    _local.metrics = None
+    return metrics
+
+
+class measure(object):
+    """
+    with measure(SETUP): ...  (do nothing, if not activated)
+    on hot paths, check current_metrics() first, and pass it (not to create this object if not activated).
+    """
+    __slots__ = ("phase", "metrics")
+
+    def __init__(self, phase, metrics=None):
+        self.phase = phase
+        self.metrics = metrics
+
+    def __enter__(self):
+        if self.metrics is None:
+            self.metrics = current_metrics()
+        if self.metrics is not None:
+            self.metrics.enter()
+        return self.metrics
+
+    def __exit__(self, typ, val, tb):
+        if self.metrics is not None:
+            self.metrics.exit(self.phase)
+
+
+def count_rows(n):
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.rows += n
+
+
+class QueryRecorder(object):
+    """recording count and time of sql queries, without DEBUG=True"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.stack = ExitStack()
+        self.logged = []  # (<connection>, <force_debug_cursor>, <len of queries_log>)[]
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.metrics.add(SQL, time.time() - start)
+            self.metrics.query_count += 1
+
+    def start(self):
+        from django.db import connections
+        for connection in connections.all():
+            if hasattr(connection, "execute_wrapper"):
+                self.stack.enter_context(connection.execute_wrapper(self))
+            else:  # django < 2.0
+                self.logged.append((connection, connection.force_debug_cursor, len(connection.queries_log)))
+                connection.force_debug_cursor = True
+
+    def stop(self):
+        # django < 2.0, the queries are collected after the response (sql time is also included in the other phases)
+        self.stack.close()
+        for connection, force_debug_cursor, n in self.logged:
+            for query in list(connection.queries_log)[n:]:
+                self.metrics.add(SQL, float(query.get("time") or 0.0))
+                self.metrics.query_count += 1
+            connection.force_debug_cursor = force_debug_cursor
+        self.logged = []
+
+
+# sinks
+class LoggingSink(object):
+    def __init__(self, logger=logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, metrics, request, response):
+        self.logger.log(self.level, "%s %s metrics=%s", request.method, request.path, dict(metrics.asdict()))
+
+
+class HeaderSink(object):
+    """e.g. Server-Timing: setup;dur=0.120, ..., sql;dur=1.021;desc="3 queries" """
+
+    def __init__(self, header_name="Server-Timing", prefix="drf-"):
+        self.header_name = header_name
+        self.prefix = prefix
+
+    def __call__(self, metrics, request, response):
+        values = []
+        for phase, elapsed in metrics.timings.items():
+            value = "{}{};dur={:.3f}".format(self.prefix, phase, elapsed * 1000)
+            if phase == SQL:
+                value = '{};desc="{} queries"'.format(value, metrics.query_count)
+            values.append(value)
+        response[self.header_name] = ", ".join(values)
+
+
+class CallbackSink(object):
+    """for statsd-like collectors, fn(name, value)"""
+
+    def __init__(self, fn, prefix="returnfields."):
+        self.fn = fn
+        self.prefix = prefix
+
+    def __call__(self, metrics, request, response):
+        for name, value in metrics.asdict().items():
+            self.fn("{}{}".format(self.prefix, name), value)
+
+
+def _default_sinks():
+    from .conf import returnfields_settings, get_sinks
+    sinks = get_sinks(returnfields_settings)
+    return [LoggingSink()] if sinks is None else sinks
+
+
+class InstrumentationMiddleware(object):
+    get_sinks = staticmethod(_default_sinks)
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+        self.sinks = self.get_sinks()
+
+    def __call__(self, request):
+        self.process_request(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_request(self, request):
+        recorder = QueryRecorder(activate())
+        recorder.start()
+        request._drf__query_recorder = recorder
+
+    def process_response(self, request, response):
+        recorder = getattr(request, "_drf__query_recorder", None)
+        if recorder is None:
+            return response
+        recorder.stop()
+        metrics = deactivate()
+        for sink in self.sinks:
+            try:
+                sink(metrics, request, response)
+            except Exception:
+                logger.warning("sink %r is failed", sink, exc_info=True)
+        return response
@@ -0,0 +1,30 @@
+# -*- coding:utf-8 -*-
+import json
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = "explaining the optimized query of a serializer with the selection (e.g. myapp.serializers.UserSerializer --return-fields=id,skills)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("serializer", help="dotted path of the serializer class (having Meta.model)")
+        parser.add_argument("--return-fields", dest="return_fields", default="")
+        parser.add_argument("--skip-fields", dest="skip_fields", default="")
+
+    def handle(self, *args, **options):
+        from django_returnfields import serializer_factory
+        from django_returnfields.conf import returnfields_settings
+        from django_returnfields.diagnostics import explain
+
+        serializer_class = serializer_factory(import_string(options["serializer"]))
+        params = {returnfields_settings.AGGRESSIVE_KEY: "1"}
+        if options["return_fields"]:
+            params[returnfields_settings.INCLUDE_KEY] = options["return_fields"]
+        if options["skip_fields"]:
+            params[returnfields_settings.EXCLUDE_KEY] = options["skip_fields"]
+        context = {"request": RequestFactory().get("/", params)}
+        queryset = serializer_class.Meta.model._default_manager.all()
+        result = explain(serializer_class, queryset, context)
+        self.stdout.write(json.dumps(result, indent=2, default=str))
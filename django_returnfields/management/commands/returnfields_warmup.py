@@ -0,0 +1,19 @@
+# -*- coding:utf-8 -*-
+from django.core.management.base import BaseCommand
+try:
+    from django.urls import get_resolver
+except ImportError:  # django < 1.10
+    from django.core.urlresolvers import get_resolver
+
+
+class Command(BaseCommand):
+    help = "upgrading all lazily created return fields serializers (serializer_factory(..., lazy=True)), and precompiling them"
+
+    def handle(self, *args, **options):
+        from django_returnfields import warmup, precompile
+        # importing views (and serializers) via urlconf
+        get_resolver().url_patterns
+        n = warmup()
+        self.stdout.write("{} serializers are upgraded".format(n))
+        n = precompile()
+        self.stdout.write("{} serializers are precompiled".format(n))
@@ -0,0 +1,27 @@
+# -*- coding:utf-8 -*-
+from django.shortcuts import get_object_or_404
+from rest_framework.response import Response
+from .aggressive import OptimizedInstance
+
+
+class AggressiveRetrieveMixin(object):
+    """
+    retrieve action, fetching the object with the optimized query directly.
+    (DRF's retrieve fetches the object by get_object(), and the serializer fetches it again with the optimized query)
+    single-valued nested serializers are select_related(), so the response is built by one JOINed query.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        optimized = None
+        if hasattr(serializer_class, "optimize_queryset"):
+            optimized = serializer_class.optimize_queryset(
+                self.filter_queryset(self.get_queryset()), self.get_serializer_context()
+            )
+        if optimized is None:
+            return super(AggressiveRetrieveMixin, self).retrieve(request, *args, **kwargs)
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        ob = get_object_or_404(optimized, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, ob)
+        return Response(self.get_serializer(OptimizedInstance(ob)).data)
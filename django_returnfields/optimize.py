@@ -1,10 +1,17 @@
+import copy
 import logging
+import weakref
 from collections import OrderedDict
+from itertools import chain
 from . import aggressive
 from . import constants
+from . import instrumentation
+from .conf import returnfields_settings as _settings, get_view_option, resolve, DEFAULTS, FROM_SETTINGS
+from .structures import LRUCache
 
 logger = logging.getLogger(__name__)
 DECORATE_KEY = "_drf_decorated"
+PLAN_CACHE_SIZE = DEFAULTS["PLAN_CACHE_SIZE"]  # 0 is disabled
 
 
 class StaticToken(object):
@@ -20,6 +27,12 @@ class StaticToken(object):
     def __call__(self, context):
         return self.queryname
 
+    def querynames(self):
+        return (self.queryname, )
+
+    def requirements(self):
+        return ()
+
 
 class RelatedToken(object):
     def __init__(self, translator, name, nested, queryname, mapping):
@@ -33,37 +46,156 @@ class RelatedToken(object):
         return self.__class__(self, name=fullname, nested=self.nested, queryname=fullqueryname, mapping=self.mapping)
 
     def __call__(self, context):
-        return ["{}__{}".format(self.queryname, t(context)) for t in self.mapping.values()]
+        # the fields of nested serializers are also flattened in the mapping, so RelatedToken is skipped
+        names = flatten1(t(context) for t in self.mapping.values() if not isinstance(t, RelatedToken))
+        return ["{}__{}".format(self.queryname, name) for name in names]
+
+    def querynames(self):
+        r = []
+        for t in self.mapping.values():
+            if isinstance(t, RelatedToken):
+                continue
+            names = t.querynames()
+            if names is None:
+                return None
+            r.extend("{}__{}".format(self.queryname, name) for name in names)
+        return tuple(r)
+
+    def requirements(self):
+        r = []
+        for t in self.mapping.values():
+            if isinstance(t, RelatedToken):
+                continue
+            for name, path, requirement in t.requirements():
+                path = "{}__{}".format(self.queryname, path) if path else self.queryname
+                r.append(("{}__{}".format(self.name, name), path, requirement))
+        return tuple(r)
 
 
 class DynamicToken(object):
-    def __init__(self, translator, name, nested, queryname, fn):
+    def __init__(self, translator, name, nested, queryname, fn, requirement=None):
         self.translator = translator
         self.name = name
         self.nested = nested
         self.queryname = queryname
         self.fn = fn
+        self.requirement = requirement
 
     def renamed(self, fullname, fullqueryname):
-        return self.__class__(self, name=fullname, nested=self.nested, queryname=fullqueryname, fn=self.fn)
+        return self.__class__(
+            self, name=fullname, nested=self.nested, queryname=fullqueryname, fn=self.fn, requirement=self.requirement
+        )
 
     # with decorators
     def __call__(self, context):
         return self.fn(self, context)
 
+    def querynames(self):
+        return None  # evaluated per request
+
+    def requirements(self):
+        # (<field name>, <relation path of the serializer having the field>, <Requirement>)
+        if self.requirement is None:
+            return ()
+        return ((self.name, self.queryname.rpartition("__")[0], self.requirement), )
+
+
+class AggregateToken(object):
+    # AggregateField, no columns are selected. instead, the queryset is annotated
+    def __init__(self, translator, name, nested, queryname, requirement):
+        self.translator = translator
+        self.name = name
+        self.nested = nested
+        self.queryname = queryname
+        self.requirement = requirement
+
+    def renamed(self, fullname, fullqueryname):
+        return self.__class__(self, name=fullname, nested=self.nested, queryname=fullqueryname, requirement=self.requirement)
+
+    def __call__(self, context):
+        return []
+
+    def querynames(self):
+        return ()
+
+    def requirements(self):
+        return ((self.name, self.queryname.rpartition("__")[0], self.requirement), )
+
+
+class Requirement(object):
+    """relations to prefetch and annotations (e.g. Count, Subquery), needed by a method field"""
+
+    def __init__(self, prefetch=(), annotate=None):
+        self.prefetch = tuple(prefetch)
+        self.annotate = annotate or {}
+
+    def apply(self, qs, path=""):
+        if self.annotate:
+            if not path:
+                qs = qs.annotate(**self.annotate)
+            else:
+                annotated = aggressive.map_prefetch(qs, path, lambda sub_qs: sub_qs.annotate(**self.annotate))
+                if annotated is None:
+                    logger.warning("%s is not prefetched, annotations %s are ignored", path, list(self.annotate))
+                else:
+                    qs = annotated
+        if self.prefetch:
+            # merged with the prefetch_related() lookups of the optimization (the same lookup cannot be prefetched twice)
+            merged = None
+            if path:
+                merged = aggressive.map_prefetch(qs, path, lambda sub_qs: aggressive.merge_prefetch(sub_qs, self.prefetch))
+            if merged is None:
+                merged = aggressive.merge_prefetch(qs, [prefixed_lookup(lookup, path) for lookup in self.prefetch])
+            qs = merged
+        return qs
+
+
+def prefixed_lookup(lookup, path):
+    if not path:
+        return lookup
+    elif isinstance(lookup, str):
+        return "{}__{}".format(path, lookup)
+    lookup = copy.copy(lookup)  # Prefetch object
+    lookup.add_prefix(path)
+    return lookup
+
 
 class QueryOptimizer(object):
     view_aggressive_query_method_name = "aggressive_queryset"
+    view_plan_cacheable_attribute_name = "aggressive_plan_cacheable"
 
-    def __init__(self, restriction, translator=None):
+    def __init__(self, restriction, translator=None, plan_cache_size=FROM_SETTINGS, values_evaluation=False):
         self.restriction = restriction
-        self.translator = translator or NameListTranslator()
+        self.translator = translator or default_translator
+        # (<Serializer class>, <model>, name_list, skip_list, <View class>) -> <QueryPlan>
+        self.plan_cache = LRUCache(maxsize=resolve(plan_cache_size, "PLAN_CACHE_SIZE"))
+        # if true, flat (or fk only) selections are evaluated by values_list(), without model instances
+        self.values_evaluation = values_evaluation
+
+    def can_evaluate_values(self, context):
+        return self.values_evaluation and self.restriction.can_optimize(context)
+
+    def invalidate_plans(self, serializer_class=None):
+        if serializer_class is None:
+            return self.plan_cache.clear()
+        for k in self.plan_cache.keys():
+            if k[0] is serializer_class:
+                self.plan_cache.pop(k)
 
     def optimize_query(self, context, instance, serializer_class):
-        qs = self._as_query(context, instance)
-        optimized_qs = self._optimize_query(context, qs, serializer_class)
+        with instrumentation.measure(instrumentation.OPTIMIZATION) as metrics:
+            qs = self._as_query(context, instance)
+            optimized_qs = self._optimize_query(context, qs, serializer_class)
+            if metrics is not None and hasattr(optimized_qs, "to_queryset"):
+                optimized_qs.to_queryset()  # building lazy query, eagerly
         return optimized_qs
 
+    def optimize_queryset(self, context, qs, serializer_class):
+        # for the queryset before slicing (pagination), so reviving is not needed
+        with instrumentation.measure(instrumentation.OPTIMIZATION):
+            aqs = self._optimize_query(context, qs, serializer_class)
+            return aqs.to_queryset() if hasattr(aqs, "to_queryset") else aqs
+
     def _as_query(self, context, data):
         # if paginated view, then data is maybe list type object.
         # and `order_by, group_by, select_related, ..` hints are dropped.
@@ -86,15 +218,20 @@ class QueryOptimizer(object):
             logger.warning("%s doen't have all method. this is not query", query)
             return query
 
-        frame = self.restriction.frame_management.current_frame(context)
+        name_list, skip_list, requirements = self._translate_selection(context, serializer_class)
+
+        # the plan is keyed by translated name list, so the results of dynamic tokens are also concerned
+        plan_key = self._get_plan_key(context, query, serializer_class, name_list, skip_list)
+        if plan_key is not None:
+            plan = self.plan_cache.get(plan_key)
+            if plan is not None:
+                return apply_requirements(plan.replay(query), requirements)
 
-        skip_list = frame.get(self.restriction.exclude_key, None)
-        name_list = frame.get(self.restriction.include_key, None)
-        name_list = self.translator.translate(serializer_class, name_list, context)
         aqs = aggressive.aggressive_query(
             query,
             name_list=name_list,
-            skip_list=skip_list
+            skip_list=skip_list,
+            select_related=self.get_select_related(serializer_class, name_list, skip_list),
         )
         # custom hook
         if "view" in context:
@@ -102,26 +239,91 @@ class QueryOptimizer(object):
             custom_fn_by_view = getattr(view, self.view_aggressive_query_method_name, None)
             if custom_fn_by_view:
                 aqs = custom_fn_by_view(aqs)
+
+        if plan_key is not None:
+            self.plan_cache.set(plan_key, aggressive.QueryPlan.from_queryset(aqs.to_queryset()))
+        if requirements:  # not included in the plan, applied for each query
+            return apply_requirements(aqs.to_queryset(), requirements)
         return aqs
 
+    def _translate_selection(self, context, serializer_class):
+        frame = self.restriction.frame_management.current_frame(context)
+
+        selection = frame.selection
+        skip_list = list(selection.excludes)
+        name_list = list(selection.includes)
+        requirements = self.translator.requirements(serializer_class, name_list, skip_list)
+        name_list = self.translator.translate(serializer_class, name_list, context)
+        for path, _ in requirements:
+            # the relation of a nested method field is fetched, even if no columns are selected
+            if path and not any(name.startswith(path + "__") for name in name_list):
+                name_list.append("{}__pk".format(path))
+        return name_list, skip_list, requirements
+
+    def describe(self, context, serializer_class):
+        """the translated selection, for diagnostics"""
+        name_list, skip_list, requirements = self._translate_selection(context, serializer_class)
+        return OrderedDict([
+            ("name_list", name_list),
+            ("skip_list", skip_list),
+            ("select_related", self.get_select_related(serializer_class, name_list, skip_list)),
+            ("requirements", [
+                OrderedDict([("path", path), ("annotate", sorted(r.annotate)), ("prefetch", [getattr(x, "prefetch_to", x) for x in r.prefetch])])
+                for path, r in requirements
+            ]),
+        ])
+
+    def get_select_related(self, serializer_class, name_list, skip_list):
+        # joining single-valued nested serializers, only if some of their fields are selected
+        names = [name for name in name_list if not any(is_prefixed(name, skip) for skip in skip_list)]
+        return [
+            path for path in self.translator.single_valued_paths(serializer_class)
+            if any(name.startswith(path + "__") for name in names)
+        ]
+
+    def _get_plan_key(self, context, query, serializer_class, name_list, skip_list):
+        if not self.plan_cache.maxsize:
+            return None
+        view = context.get("view")
+        cacheable = getattr(view, self.view_plan_cacheable_attribute_name, None)
+        if getattr(view, self.view_aggressive_query_method_name, None) is not None:
+            # the custom hook can depend on the request (e.g. request.user), cached only if opted in explicitly
+            if cacheable is not True:
+                return None
+        elif cacheable is False:
+            return None
+        if not get_view_option(view, "PLAN_CACHEABLE", _settings.PLAN_CACHEABLE):
+            return None
+        return (
+            serializer_class,
+            query.model,
+            tuple(sorted(set(name_list))),
+            tuple(sorted(set(skip_list))),
+            view.__class__ if view is not None else None,
+        )
+
 
 class NameListTranslator(object):
     ALL_LIST = [constants.ALL]
 
     def __init__(self):
-        self.fields_cache = {}  # <Serializer class> -> (str -> <Field>)
-        self.mapping_cache = {}  # <Serializer class> -> (str -> <Token>)
+        # weakly keyed, not to keep serializer classes alive (e.g. evicted from the registry of serializer_factory)
+        self.fields_cache = weakref.WeakKeyDictionary()  # <Serializer class> -> (str -> <Field>)
+        self.mapping_cache = weakref.WeakKeyDictionary()  # <Serializer class> -> (str -> <Token>)
+        self.paths_cache = weakref.WeakKeyDictionary()  # <Serializer class> -> str[]
+        self.index_cache = weakref.WeakKeyDictionary()  # <Serializer class> -> <TranslationIndex>
 
     def translate(self, serializer_class, name_list, context, include_all=False):
         if name_list == self.ALL_LIST:
             name_list = None
-        mapping = self.get_mapping(serializer_class)
+        index = self.get_index(serializer_class)
         if name_list:
-            return flatten1(mapping[name](context) for name in name_list if name in mapping)
+            entries = index.entries
+            return index.expand([entries[name] for name in name_list if name in entries], context)
         elif include_all:
-            return flatten1(token(context) for token in mapping.values())
+            return index.expand(index.all_entries, context)
         else:
-            return flatten1(token(context) for token in mapping.values() if not token.nested)
+            return index.expand(index.plain_entries, context)
 
     def all_name_list(self, serializer_class):
         return self.translate(serializer_class, None, {})
@@ -132,6 +334,68 @@ class NameListTranslator(object):
             mapping = self.mapping_cache[serializer_class] = self._get_mapping(serializer_class)
         return mapping
 
+    def requirements(self, serializer_class, name_list, skip_list=()):
+        """(<relation path>, <Requirement>) of the selected method fields"""
+        if name_list == self.ALL_LIST:
+            name_list = None
+        index = self.get_index(serializer_class)
+        if name_list:
+            candidates = chain.from_iterable(index.requirements.get(name, ()) for name in name_list)
+        else:
+            candidates = index.plain_requirements
+        r = []
+        for name, path, requirement in candidates:
+            if any(is_prefixed(name, skip) for skip in skip_list):
+                continue
+            if (path, requirement) not in r:
+                r.append((path, requirement))
+        return r
+
+    def get_index(self, serializer_class):
+        index = self.index_cache.get(serializer_class)
+        if index is None:
+            index = self.index_cache[serializer_class] = TranslationIndex(self.get_mapping(serializer_class))
+        return index
+
+    def single_valued_paths(self, serializer_class):
+        # e.g. ["user", "user__profile"], for nested serializers (not many) reachable without prefetching
+        paths = self.paths_cache.get(serializer_class)
+        if paths is None:
+            paths = self.paths_cache[serializer_class] = list(self._iterate_single_valued_paths(serializer_class))
+        return paths
+
+    def _iterate_single_valued_paths(self, serializer_class, prefix="", model=None):
+        model = model or getattr(getattr(serializer_class, "Meta", None), "model", None)
+        if model is None:
+            return
+        for name, field in self.get_fields(serializer_class).items():
+            if field.write_only or hasattr(field, "child") or not hasattr(field, "_declared_fields"):
+                continue
+            if field.source == "*" or self.get_decoration(serializer_class, name, field) is not None:
+                continue
+            related_model = self._get_forward_related_model(model, self._get_queryname(field, name))
+            if related_model is None:  # e.g. property, method, reverse or many-to-many relation
+                continue
+            path = "{}{}".format(prefix, self._get_queryname(field, name))
+            yield path
+            for subpath in self._iterate_single_valued_paths(field.__class__, prefix=path + "__", model=related_model):
+                yield subpath
+
+    def _get_forward_related_model(self, model, name):
+        from django.core.exceptions import FieldDoesNotExist
+        try:
+            f = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not f.is_relation or f.many_to_many or f.auto_created:
+            return None
+        return f.related_model
+
+    def compile(self, serializer_class):
+        # building the caches eagerly (e.g. at startup), instead of the first request
+        self.get_index(serializer_class)
+        self.single_valued_paths(serializer_class)
+
     def get_fields(self, serializer_class):
         fields = self.fields_cache.get(serializer_class)
         if fields is None:
@@ -151,7 +415,6 @@ class NameListTranslator(object):
     def _get_mapping(self, serializer_class):
         fields = self.get_fields(serializer_class)
         d = OrderedDict()
-        # todo: supporting SerializerMethodField
         for name, field in fields.items():
             if field.write_only:
                 continue
@@ -162,6 +425,11 @@ class NameListTranslator(object):
                 d[name] = token_factory(self, name)
                 continue
 
+            if hasattr(field, "aggregate"):  # AggregateField
+                requirement = Requirement(annotate={self._get_queryname(field, name): field.aggregate})
+                d[name] = AggregateToken(self, name=name, nested=False, queryname=name, requirement=requirement)
+                continue
+
             if hasattr(field, "child"):
                 field = field.child  # ListSerialier -> Serializer
             if hasattr(field, "child_relation"):  # ModelField
@@ -188,6 +456,64 @@ class NameListTranslator(object):
         return d
 
 
+class TranslationIndex(object):
+    """
+    precomputed query names of a mapping. (str -> tuple of query names, or <Token> evaluated per request)
+    only dynamic tokens (and related tokens including them) are called in translation.
+    """
+
+    def __init__(self, mapping):
+        self.entries = OrderedDict()
+        for name, token in mapping.items():
+            querynames = token.querynames()
+            self.entries[name] = token if querynames is None else querynames
+        self.all_entries = coalesce(self.entries.values())
+        self.plain_entries = coalesce(v for name, v in self.entries.items() if not mapping[name].nested)
+        self.requirements = {name: token.requirements() for name, token in mapping.items() if token.requirements()}
+        self.plain_requirements = tuple(chain.from_iterable(
+            token.requirements() for token in mapping.values() if not token.nested
+        ))
+
+    def expand(self, entries, context):
+        r = []
+        for v in entries:
+            if v.__class__ is tuple:
+                r.extend(v)
+            else:
+                v = v(context)
+                if isinstance(v, (list, tuple)):
+                    r.extend(v)
+                else:
+                    r.append(v)
+        return r
+
+
+def coalesce(entries):
+    # joining adjacent tuples, e.g. [("id", ), ("name", ), <Token>] -> [("id", "name"), <Token>]
+    r = []
+    for v in entries:
+        if v.__class__ is tuple and r and r[-1].__class__ is tuple:
+            r[-1] = r[-1] + v
+        else:
+            r.append(v)
+    return r
+
+
+# shared by all QueryOptimizers, the mappings depend only on serializer classes.
+# (built before forking, the pages are shared by the worker processes)
+default_translator = NameListTranslator()
+
+
+def apply_requirements(qs, requirements):
+    for path, requirement in requirements:
+        qs = requirement.apply(qs, path)
+    return qs
+
+
+def is_prefixed(name, prefix):
+    return name == prefix or name.startswith(prefix + "__")
+
+
 def flatten1(xs):
     r = []
     for x in xs:
@@ -211,17 +537,56 @@ def set_decoration(serialiezer_method, fn):
     setattr(serialiezer_method, DECORATE_KEY, fn)
 
 
-def depends(on=[], nested=False):
+def make_requirement(prefetch, annotate):
+    if not prefetch and not annotate:
+        return None
+    for name, expression in (annotate or {}).items():
+        check_aggregate(name, expression)
+    return Requirement(prefetch=prefetch, annotate=annotate)
+
+
+def check_aggregate(name, expression):
+    # annotations over different multi-valued relations are joined at once (rows are multiplied),
+    # so COUNT() is inflated unless it is DISTINCT
+    from django.core.exceptions import ImproperlyConfigured
+    from django.db.models import Count
+    for x in iterate_expressions(expression):
+        if isinstance(x, Count) and not is_distinct(x):
+            raise ImproperlyConfigured("{}: use Count(..., distinct=True) or Subquery(), {!r} is inflated by joins".format(name, x))
+
+
+def iterate_expressions(expression):
+    yield expression
+    for x in getattr(expression, "get_source_expressions", list)():
+        for sub in iterate_expressions(x):
+            yield sub
+
+
+def is_distinct(aggregate):
+    if hasattr(aggregate, "distinct"):  # django >= 2.2
+        return bool(aggregate.distinct)
+    return bool(getattr(aggregate, "extra", {}).get("distinct"))
+
+
+def depends(on=[], nested=False, prefetch=(), annotate=None):
+    """
+    on: column names, prefetch: relations (or Prefetch objects), annotate: {<name>: <expression>}
+    prefetch and annotate are applied only if the field is selected
+    """
+    requirement = make_requirement(prefetch, annotate)
+
     def _depends(field):
         fn = lambda token, context: on
-        factory = lambda translator, name: DynamicToken(translator, name, nested, name, fn)
+        factory = lambda translator, name: DynamicToken(translator, name, nested, name, fn, requirement=requirement)
         set_decoration(field, factory)
         return field
     return _depends
 
 
-def contextual(fn, nested=False):
+def contextual(fn, nested=False, prefetch=(), annotate=None):
+    requirement = make_requirement(prefetch, annotate)
+
     def _contextual(field):
-        set_decoration(field, lambda translator, name: DynamicToken(translator, name, nested, name, fn))
+        set_decoration(field, lambda translator, name: DynamicToken(translator, name, nested, name, fn, requirement=requirement))
         return field
     return _contextual
@@ -0,0 +1,19 @@
+# -*- coding:utf-8 -*-
+from .aggressive import OptimizedList
+
+
+class AggressivePaginationMixin(object):
+    """applying aggressive optimization before slicing, so each page is fetched only once"""
+
+    def paginate_queryset(self, queryset):
+        serializer_class = self.get_serializer_class()
+        optimized = None
+        if hasattr(serializer_class, "optimize_queryset"):
+            optimized = serializer_class.optimize_queryset(queryset, self.get_serializer_context())
+        if optimized is None:
+            return super(AggressivePaginationMixin, self).paginate_queryset(queryset)
+
+        page = super(AggressivePaginationMixin, self).paginate_queryset(optimized)
+        if page is None:
+            return None
+        return OptimizedList(page)
@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+import logging
+from collections import OrderedDict
+from operator import attrgetter
+
+logger = logging.getLogger(__name__)
+
+
+def get_model(serializer):
+    return getattr(getattr(serializer, "Meta", None), "model", None)
+
+
+def has_plain_to_representation(serializer):
+    from rest_framework.serializers import Serializer
+    for cls in serializer.__class__.__mro__:
+        if "to_representation" not in vars(cls):
+            continue
+        if "to_restricted_fields" in vars(cls):  # ReturnFieldsSerializer
+            continue
+        return cls is Serializer
+    return False
+
+
+def get_plain_column_names(model):
+    return {f.attname for f in model._meta.concrete_fields if not f.is_relation}
+
+
+def get_fk_attnames(model):
+    # {<fk name>: <fk attname>}, e.g. {"user": "user_id"}
+    return {f.name: f.attname for f in model._meta.concrete_fields if f.many_to_one or f.one_to_one}
+
+
+def is_plain_field(field, column_names):
+    from rest_framework.fields import Field
+    return (
+        type(field).get_attribute is Field.get_attribute and
+        len(field.source_attrs) == 1 and
+        field.source in column_names
+    )
+
+
+def is_fk_field(field, fk_attnames):
+    # PrimaryKeyRelatedField reads only the fk column (without fetching the related object)
+    from rest_framework.relations import PrimaryKeyRelatedField
+    return (
+        isinstance(field, PrimaryKeyRelatedField) and
+        field.use_pk_only_optimization() and
+        len(field.source_attrs) == 1 and
+        field.source in fk_attnames
+    )
+
+
+def pk_only_representation(field):
+    from rest_framework.relations import PKOnlyObject
+    to_representation = field.to_representation
+    return lambda pk: to_representation(PKOnlyObject(pk=pk))
+
+
+class FlatRowRenderer(object):
+    """rendering rows in a tight loop, for a serializer having only plain model attributes (or fk columns)"""
+
+    def __init__(self, model, plan):
+        self.model = model
+        self.plan = plan  # (<output key>, <column name>, <attribute name>, <to_representation>)[]
+
+    @classmethod
+    def from_serializer(cls, serializer):
+        return cls.bind(serializer, cls.compile(serializer))
+
+    @classmethod
+    def compile(cls, serializer):
+        """the layout of the rows, (<model>, (<output key>, <column name>, <attribute name>, <is fk>)[]), or None"""
+        model = get_model(serializer)
+        if model is None or not has_plain_to_representation(serializer):
+            return None
+        column_names = get_plain_column_names(model)
+        fk_attnames = get_fk_attnames(model)
+        layout = []
+        for field in serializer._readable_fields:
+            if is_plain_field(field, column_names):
+                layout.append((field.field_name, field.source, field.source, False))
+            elif is_fk_field(field, fk_attnames):
+                layout.append((field.field_name, field.source, fk_attnames[field.source], True))
+            else:
+                logger.debug("flat rendering is disabled, %s.%s is not plain", serializer.__class__.__name__, field.field_name)
+                return None
+        if not layout:
+            return None
+        return (model, tuple(layout))
+
+    @classmethod
+    def bind(cls, serializer, layout):
+        # to_representation of the fields are taken from the serializer (the layout can be shared)
+        if layout is None:
+            return None
+        model, layout = layout
+        fields = serializer.fields
+        plan = []
+        for key, column, name, is_fk in layout:
+            field = fields[key]
+            plan.append((key, column, name, pk_only_representation(field) if is_fk else field.to_representation))
+        return cls(model, plan)
+
+    @property
+    def column_names(self):
+        return [column for _, column, _, _ in self.plan]
+
+    def can_fetch_values(self, data):
+        # evaluated queryset (or list) is rendered from model instances
+        return (
+            getattr(data, "model", None) is self.model and
+            hasattr(data, "values_list") and
+            getattr(data, "_result_cache", None) is None
+        )
+
+    def render(self, data):
+        from django.db import models
+        if isinstance(data, models.Manager):
+            data = data.all()
+        elif hasattr(type(data), "to_queryset"):  # AggressiveQuery
+            data = data.to_queryset()
+        if self.can_fetch_values(data):
+            rows = data.prefetch_related(None).values_list(*self.column_names)
+        else:
+            getter = attrgetter(*[name for _, _, name, _ in self.plan])
+            if len(self.plan) == 1:
+                rows = ((getter(ob), ) for ob in data)
+            else:
+                rows = (getter(ob) for ob in data)
+        keys = [k for k, _, _, _ in self.plan]
+        to_representations = [fn for _, _, _, fn in self.plan]
+        r = []
+        for row in rows:
+            d = OrderedDict()
+            for k, fn, v in zip(keys, to_representations, row):
+                d[k] = None if v is None else fn(v)
+            r.append(d)
+        return r
@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+from collections import OrderedDict
+from .constants import ALL
+
+
+def truncate_for_child(fields, prefix, field_name):
+    if field_name is None:
+        return fields
+    if len(fields) == 1 and fields[0] == ALL:
+        return fields
+    r = []
+    for s in fields:
+        if s.startswith(prefix):
+            r.append(s[len(prefix):])
+        elif s == field_name:
+            r.append(ALL)
+    return r
+
+
+def split_by_head(fields):
+    # ["user__id", "user", "name"] -> {"user": ["id", ALL], "name": [ALL]}
+    d = OrderedDict()
+    if len(fields) == 1 and fields[0] == ALL:
+        return d
+    for s in fields:
+        if s == ALL:
+            continue
+        head, sep, tail = s.partition("__")
+        d.setdefault(head, []).append(tail if sep else ALL)
+    return d
+
+
+class FieldSelection(object):
+    """compiled return_fields/skip_fields, a node per path segment"""
+
+    def __init__(self, includes, excludes):
+        self.includes = tuple(includes)
+        self.excludes = tuple(excludes)
+        self.include_all = ALL in self.includes
+        self.included_names = frozenset(s.split("__", 1)[0] for s in self.includes)
+        self.excluded_names = tuple(s for s in self.excludes if s != ALL and "__" not in s)
+        # normalized, the order and duplication of names are ignored
+        self.key = (self.include_all, None if self.include_all else self.included_names, frozenset(self.excluded_names))
+        self.children = {}
+        self._default = None
+
+    @classmethod
+    def compile(cls, includes, excludes):
+        node = cls(includes, excludes)
+        include_map = split_by_head(node.includes)
+        exclude_map = split_by_head(node.excludes)
+        for name in set(include_map).union(exclude_map):
+            node.children[name] = cls.compile(
+                include_map.get(name) or node._default_fields(node.includes),
+                exclude_map.get(name) or node._default_fields(node.excludes),
+            )
+        return node
+
+    def _default_fields(self, fields):
+        if len(fields) == 1 and fields[0] == ALL:
+            return fields
+        return ()
+
+    @property
+    def default(self):
+        # selection for a field not mentioned in return_fields/skip_fields
+        if self._default is None:
+            includes = self._default_fields(self.includes)
+            excludes = self._default_fields(self.excludes)
+            if includes == self.includes and excludes == self.excludes:
+                self._default = self
+            else:
+                self._default = self.__class__(includes, excludes)
+        return self._default
+
+    def child(self, field_name):
+        if field_name is None:
+            return self
+        node = self.children.get(field_name)
+        if node is None:
+            return self.default
+        return node
+
+    def __repr__(self):
+        return "<{} includes={!r} excludes={!r}>".format(self.__class__.__name__, self.includes, self.excludes)
+
+
+class Frame(object):
+    """an element of the serializer path (context[PATH_KEY]), child frames are shared"""
+    __slots__ = ("name", "selection", "toplevel", "_children")
+
+    def __init__(self, name, selection, toplevel=False):
+        self.name = name
+        self.selection = selection
+        self.toplevel = toplevel
+        self._children = None
+
+    def child(self, field_name):
+        if self._children is None:
+            self._children = {}
+        frame = self._children.get(field_name)
+        if frame is None:
+            frame = self._children[field_name] = self.__class__(field_name, self.selection.child(field_name))
+        return frame
+
+    def __repr__(self):
+        return "<{} name={!r} selection={!r}>".format(self.__class__.__name__, self.name, self.selection)
@@ -0,0 +1,47 @@
+# -*- coding:utf-8 -*-
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from .conf import returnfields_settings as _settings, get_view_option
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """rendering an iterable of rows as a JSON array, element by element"""
+
+    def render_iter(self, rows, accepted_media_type=None, renderer_context=None):
+        yield b"["
+        delimiter = b""
+        for row in rows:
+            yield delimiter
+            yield self.render(row, accepted_media_type=accepted_media_type, renderer_context=renderer_context)
+            delimiter = b","
+        yield b"]"
+
+
+class StreamingResponse(StreamingHttpResponse):
+    def __init__(self, rows, renderer=None, status=None, renderer_context=None):
+        self.renderer = renderer or StreamingJSONRenderer()
+        content = self.renderer.render_iter(rows, renderer_context=renderer_context)
+        super(StreamingResponse, self).__init__(content, status=status, content_type=self.renderer.media_type)
+
+
+class StreamingListModelMixin(object):
+    """
+    list action, using `serializer_factory`-wrapped serializer's `iter_representation()`.
+    if the view is paginated, or the negotiated renderer is not JSON (e.g. the browsable API), the default list() is used.
+    """
+    streaming_chunk_size = None  # default is RETURNFIELDS["STREAMING_CHUNK_SIZE"]
+
+    def list(self, request, *args, **kwargs):
+        if not self.can_stream(request):
+            return super(StreamingListModelMixin, self).list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        serializer = self.get_serializer(queryset, many=True)
+        chunk_size = get_view_option(self, "STREAMING_CHUNK_SIZE", self.streaming_chunk_size or _settings.STREAMING_CHUNK_SIZE)
+        rows = serializer.iter_representation(serializer.instance, chunk_size=chunk_size)
+        return StreamingResponse(rows, renderer_context=self.get_renderer_context())
+
+    def can_stream(self, request):
+        return isinstance(getattr(request, "accepted_renderer", None), JSONRenderer)
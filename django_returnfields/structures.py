@@ -0,0 +1,121 @@
+# -*- coding:utf-8 -*-
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple("CacheInfo", "hits, misses, maxsize, currsize")
+
+
+class LRUCache(object):
+    """bounded mapping, least recently used entries are dropped at first"""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, k, default=None):
+        with self._lock:
+            try:
+                v = self._data[k]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(k)
+            self.hits += 1
+            return v
+
+    def set(self, k, v):
+        if self.maxsize is not None and self.maxsize <= 0:
+            return v
+        with self._lock:
+            self._data[k] = v
+            self._data.move_to_end(k)
+            if self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return v
+
+    def pop(self, k, default=None):
+        with self._lock:
+            return self._data.pop(k, default)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(hits=self.hits, misses=self.misses, maxsize=self.maxsize, currsize=len(self._data))
+
+    def __contains__(self, k):
+        return k in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ClassRegistry(object):
+    """
+    weak-valued mapping for dynamically created classes.
+    recently used classes are kept alive (at most `maxsize`), the others live only while they are referenced.
+    """
+
+    def __init__(self, maxsize=128):
+        self.lock = threading.RLock()  # held while creating a class
+        self.hits = 0
+        self.misses = 0
+        self._refs = weakref.WeakValueDictionary()
+        self._get_maxsize = maxsize if callable(maxsize) else None  # resolved on first use
+        self._pinned = LRUCache(maxsize=None if callable(maxsize) else maxsize)
+
+    @property
+    def pinned(self):
+        if self._get_maxsize is not None:
+            self._pinned.maxsize = self._get_maxsize()
+            self._get_maxsize = None
+        return self._pinned
+
+    @property
+    def maxsize(self):
+        return self.pinned.maxsize
+
+    def get(self, k, default=None):
+        with self.lock:
+            v = self._refs.get(k)
+            if v is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.pinned.set(k, v)
+            return v
+
+    def set(self, k, v):
+        with self.lock:
+            self._refs[k] = v
+            self.pinned.set(k, v)
+        return v
+
+    def values(self):
+        with self.lock:
+            return list(self._refs.values())
+
+    def clear(self):
+        with self.lock:
+            self._refs.clear()
+            self._pinned.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(hits=self.hits, misses=self.misses, maxsize=self.maxsize, currsize=len(self._refs))
+
+    def __contains__(self, k):
+        return k in self._refs
+
+    def __len__(self):
+        return len(self._refs)
@@ -1,5 +1,8 @@
 # -*- coding:utf-8 -*-
+from django.db.models import Count, Prefetch
 from rest_framework import serializers
+from django_returnfields import depends
+from django_returnfields.fields import AggregateField
 from .models import Skill, User, Group
 
 
@@ -23,6 +26,12 @@ class SkillUserSerializer(serializers.ModelSerializer):
         fields = ('id', 'skills', 'username')
 
 
+class SkillWithUserIdSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Skill
+        fields = ('id', 'name', 'user')
+
+
 class SkillSerializer(serializers.ModelSerializer):
     user = UserSerializer()
 
@@ -31,6 +40,15 @@ class SkillSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'name')
 
 
+class SkillWithDetailSerializer(serializers.ModelSerializer):
+    user = UserSerializer()
+    detail = SkillOnlySerializer(source="*")
+
+    class Meta:
+        model = Skill
+        fields = ('id', 'user', 'detail')
+
+
 class GroupOnlySerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
@@ -50,3 +68,43 @@ class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = ('id', 'user', 'name')
+
+
+class SkillStatsUserSerializer(serializers.ModelSerializer):
+    skill_count = serializers.SerializerMethodField()
+    skill_names = serializers.SerializerMethodField()
+    n_skills = AggregateField(Count("skills", distinct=True))
+    n_groups = AggregateField(Count("groups", distinct=True))
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'skill_count', 'skill_names', 'n_skills', 'n_groups')
+
+    @depends(annotate={"n_skills": Count("skills", distinct=True)})
+    def get_skill_count(self, ob):
+        return ob.n_skills if hasattr(ob, "n_skills") else ob.skills.count()
+
+    @depends(prefetch=["skills"])
+    def get_skill_names(self, ob):
+        return sorted(skill.name for skill in ob.skills.all())
+
+
+class MagicSkillUserSerializer(SkillUserSerializer):
+    # the same relation is also prefetched by the nested serializer
+    magic_skill_names = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ('id', 'skills', 'username', 'magic_skill_names')
+
+    @depends(prefetch=[Prefetch("skills", queryset=Skill.objects.filter(name="magic"), to_attr="magic_skills")])
+    def get_magic_skill_names(self, ob):
+        return sorted(skill.name for skill in ob.magic_skills)
+
+
+class SkillStatsGroupSerializer(serializers.ModelSerializer):
+    users = SkillStatsUserSerializer(many=True, source="user_set")
+
+    class Meta:
+        model = Group
+        fields = ('id', 'name', 'users')
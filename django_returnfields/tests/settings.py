@@ -12,6 +12,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.staticfiles',
     "rest_framework",
+    'django_returnfields',
     'django_returnfields.tests',
 ]
 MIDDLEWARE_CLASSES = (
@@ -0,0 +1,318 @@
+# -*- coding:utf-8 -*-
+from django.test import TestCase
+from rest_framework.test import APITestCase
+
+
+class NestedPrefetchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import User, Group, Skill
+        user = User.objects.create_superuser('admin', 'myemail@test.com', '')
+        group = Group.objects.create(name="magic")
+        Skill.objects.create(user=user, name="magic")
+        Skill.objects.create(user=user, name="magik")
+        group.user_set.add(user)
+
+    def _callFUT(self, qs, name_list, skip_list=None):
+        from django_returnfields.aggressive import aggressive_query
+        return aggressive_query(qs, name_list, skip_list=skip_list).to_queryset()
+
+    def _only_fields(self, qs):
+        names, defer = qs.query.deferred_loading
+        self.assertFalse(defer)
+        return set(names)
+
+    def test_nested_prefetch(self):
+        from .models import Group
+        qs = self._callFUT(Group.objects.all(), ["name", "user_set__username", "user_set__skills__name"])
+
+        prefetch, = qs._prefetch_related_lookups
+        self.assertEqual(prefetch.prefetch_through, "user_set")
+        self.assertIn("username", self._only_fields(prefetch.queryset))
+
+        sub_prefetch, = prefetch.queryset._prefetch_related_lookups
+        self.assertEqual(sub_prefetch.prefetch_through, "skills")
+        self.assertEqual(self._only_fields(sub_prefetch.queryset), {"name", "user_id"})  # with fk column for joining
+
+        with self.assertNumQueries(3):
+            group = qs.get()
+            users = list(group.user_set.all())
+            self.assertEqual([u.username for u in users], ["admin"])
+            self.assertEqual(sorted(s.name for s in users[0].skills.all()), ["magic", "magik"])
+
+    def test_nested_prefetch__with_skip(self):
+        from .models import Group
+        qs = self._callFUT(Group.objects.all(), ["name", "user_set__username", "user_set__skills__name"], ["user_set__skills"])
+        prefetch, = qs._prefetch_related_lookups
+        self.assertEqual(list(prefetch.queryset._prefetch_related_lookups), [])
+
+    def test_fk_without_subfields(self):
+        from .models import Skill
+        qs = self._callFUT(Skill.objects.all(), ["name", "user"])
+        self.assertEqual(self._only_fields(qs), {"name", "user"})
+        with self.assertNumQueries(1):
+            self.assertTrue(all(s.user_id for s in qs))
+
+    def test_prefetch_filter(self):
+        from .models import Group
+        from django_returnfields.aggressive import aggressive_query
+        aqs = aggressive_query(Group.objects.all(), ["user_set__username", "user_set__skills__name"])
+        aqs = aqs.prefetch_filter(user_set__skills=lambda qs: qs.filter(name="magik"))
+        group = aqs.to_queryset().get()
+        self.assertEqual([s.name for s in group.user_set.all()[0].skills.all()], ["magik"])
+
+    def test_prefetch_filter__not_shared(self):
+        from .models import Group
+        from django_returnfields.aggressive import aggressive_query
+        name_list = ["user_set__username", "user_set__skills__name"]
+        aggressive_query(Group.objects.all(), name_list).prefetch_filter(user_set__skills=lambda qs: qs.none())
+        group = aggressive_query(Group.objects.all(), name_list).to_queryset().get()
+        self.assertEqual(len(group.user_set.all()[0].skills.all()), 2)
+
+
+class SelectRelatedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import User, Skill
+        user = User.objects.create_superuser('admin', 'myemail@test.com', '')
+        Skill.objects.create(user=user, name="magic")
+
+    def _callFUT(self, qs, name_list, select_related, skip_list=None):
+        from django_returnfields.aggressive import aggressive_query
+        return aggressive_query(qs, name_list, skip_list=skip_list, select_related=select_related).to_queryset()
+
+    def test_single_valued_paths(self):
+        from django_returnfields.optimize import NameListTranslator
+        from .serializers import SkillSerializer, SkillUserSerializer
+        translator = NameListTranslator()
+        self.assertEqual(translator.single_valued_paths(SkillSerializer), ["user"])
+        self.assertEqual(translator.single_valued_paths(SkillUserSerializer), [])  # many=True is prefetched
+
+    def test_single_valued_paths__not_relation(self):
+        from django_returnfields.optimize import NameListTranslator
+        from .models import Skill
+        from .serializers import SkillWithDetailSerializer
+        translator = NameListTranslator()
+        paths = translator.single_valued_paths(SkillWithDetailSerializer)
+        self.assertEqual(paths, ["user"])  # source="*" is not joined
+        qs = self._callFUT(Skill.objects.all(), ["detail__name", "user__username"], paths)
+        self.assertEqual(qs.get().user.username, "admin")
+
+    def test_it(self):
+        from .models import Skill
+        qs = self._callFUT(Skill.objects.all(), ["name", "user__username"], ["user"])
+        with self.assertNumQueries(1):
+            skill = qs.get()
+            self.assertEqual(skill.user.username, "admin")
+        self.assertIn("user", qs.query.select_related)
+        self.assertEqual(list(qs._prefetch_related_lookups), [])  # not prefetched again
+
+    def test_nested_prefetch_of_joined(self):
+        from .models import Skill
+        qs = self._callFUT(Skill.objects.all(), ["name", "user__username", "user__skills__name"], ["user"])
+        self.assertEqual([x.prefetch_to for x in qs._prefetch_related_lookups], ["user__skills"])
+        with self.assertNumQueries(2):
+            skill = qs.get()
+            self.assertEqual([s.name for s in skill.user.skills.all()], ["magic"])
+
+
+class AggressiveRetrieveTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import User, Skill
+        user = User.objects.create_superuser('admin', 'myemail@test.com', '')
+        cls.skill = Skill.objects.create(user=user, name="magic")
+
+    def test_it(self):
+        path = "/api/aggressive_retrieve/skills/{}/".format(self.skill.pk)
+        with self.assertNumQueries(1):
+            response = self.client.get(path, {"aggressive": 1, "return_fields": "name,user__username"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"name": "magic", "user": {"username": "admin"}})
+
+    def test_skipped(self):
+        path = "/api/aggressive_retrieve/skills/{}/".format(self.skill.pk)
+        with self.assertNumQueries(1):
+            response = self.client.get(path, {"aggressive": 1, "skip_fields": "user"})
+        self.assertEqual(response.data, {"id": self.skill.pk, "name": "magic"})
+
+    def test_rendered_as_single_object(self):
+        from unittest import mock
+        from .viewsets import AggressiveRetrieveSkillViewSet
+        path = "/api/aggressive_retrieve/skills/{}/".format(self.skill.pk)
+        serializer_class = AggressiveRetrieveSkillViewSet.serializer_class
+        with mock.patch.object(serializer_class, "many_init", side_effect=AssertionError("not rendered as a list")):
+            response = self.client.get(path, {"aggressive": 1, "return_fields": "name"})
+        self.assertEqual(response.data, {"name": "magic"})
+
+    def test_optimized_instance(self):
+        from django.test.client import RequestFactory
+        from rest_framework.request import Request
+        from django_returnfields import serializer_factory
+        from django_returnfields.aggressive import OptimizedInstance
+        from .models import Skill
+        from .serializers import SkillSerializer
+        request = Request(RequestFactory().get("/", {"aggressive": 1, "return_fields": "name"}))
+        ob = Skill.objects.get()
+        with self.assertNumQueries(0):
+            data = serializer_factory(SkillSerializer)(OptimizedInstance(ob), context={"request": request}).data
+        self.assertEqual(data, {"name": "magic"})
+
+    def test_not_found(self):
+        response = self.client.get("/api/aggressive_retrieve/skills/0/", {"aggressive": 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_without_aggressive(self):
+        path = "/api/aggressive_retrieve/skills/{}/".format(self.skill.pk)
+        response = self.client.get(path, {"return_fields": "name"})
+        self.assertEqual(response.data, {"name": "magic"})
+
+
+class DependsRequirementTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import User, Skill, Group
+        user = User.objects.create_superuser('admin', 'myemail@test.com', '')
+        Skill.objects.create(user=user, name="magic")
+        Skill.objects.create(user=user, name="magik")
+        group = Group.objects.create(name="magic")
+        group.user_set.add(user)
+
+    def _get(self, path, return_fields):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, {"aggressive": 1, "return_fields": return_fields})
+        self.assertEqual(response.status_code, 200)
+        return response.data, [q["sql"] for q in queries.captured_queries]
+
+    def test_annotate(self):
+        data, queries = self._get("/api/skill_stats/users/", "username,skill_count")
+        self.assertEqual(data, [{"username": "admin", "skill_count": 2}])
+        self.assertEqual(len(queries), 1)
+        self.assertIn("COUNT", queries[0])
+
+    def test_prefetch(self):
+        data, queries = self._get("/api/skill_stats/users/", "username,skill_names")
+        self.assertEqual(data, [{"username": "admin", "skill_names": ["magic", "magik"]}])
+        self.assertEqual(len(queries), 2)
+
+    def test_not_selected(self):
+        data, queries = self._get("/api/skill_stats/users/", "username")
+        self.assertEqual(data, [{"username": "admin"}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("COUNT", queries[0])
+
+    def test_nested(self):
+        data, queries = self._get("/api/skill_stats/groups/", "name,users__skill_count")
+        self.assertEqual(data, [{"name": "magic", "users": [{"skill_count": 2}]}])
+        self.assertEqual(len(queries), 2)
+        self.assertIn("COUNT", queries[1])
+
+    def test_prefetch__also_prefetched_by_nested_serializer(self):
+        data, queries = self._get("/api/skill_stats/magic_users/", "username,skills__name,magic_skill_names")
+        skills = [{"name": "magic"}, {"name": "magik"}]  # not filtered by the prefetch of the method field
+        self.assertEqual(data, [{"username": "admin", "skills": skills, "magic_skill_names": ["magic"]}])
+        self.assertEqual(len(queries), 3)
+
+    def test_prefetch__merged(self):
+        from django.db.models import Prefetch
+        from django_returnfields.aggressive import merge_prefetch
+        from .models import User, Skill
+        qs = User.objects.prefetch_related(Prefetch("skills", queryset=Skill.objects.only("name", "user_id")), "groups")
+        qs = merge_prefetch(qs, [
+            "skills", "groups", Prefetch("skills", queryset=Skill.objects.filter(name="magik"), to_attr="magik_skills")
+        ])
+        self.assertEqual(
+            [getattr(x, "prefetch_to", x) for x in qs._prefetch_related_lookups], ["skills", "groups", "magik_skills"]
+        )
+        user = qs.get()
+        self.assertEqual(sorted(s.name for s in user.skills.all()), ["magic", "magik"])  # the optimized one is kept
+        self.assertEqual([s.name for s in user.magik_skills], ["magik"])
+
+    def test_prefetch__merged__filtered_without_to_attr(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from django.db.models import Prefetch
+        from django_returnfields.aggressive import merge_prefetch
+        from .models import User, Skill
+        qs = User.objects.prefetch_related(Prefetch("skills", queryset=Skill.objects.only("name", "user_id")))
+        with self.assertRaises(ImproperlyConfigured):
+            merge_prefetch(qs, [Prefetch("skills", queryset=Skill.objects.filter(name="magik"))])
+
+
+class AggregateFieldTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import User, Skill, Group
+        user = User.objects.create_superuser('admin', 'myemail@test.com', '')
+        Skill.objects.create(user=user, name="magic")
+        Skill.objects.create(user=user, name="magik")
+        group = Group.objects.create(name="magic")
+        group.user_set.add(user)
+
+    def _get(self, path, params):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, [q["sql"] for q in queries.captured_queries]
+
+    def test_annotated(self):
+        data, queries = self._get("/api/skill_stats/users/", {"aggressive": 1, "return_fields": "username,n_skills"})
+        self.assertEqual(data, [{"username": "admin", "n_skills": 2}])
+        self.assertEqual(len(queries), 1)
+        self.assertIn("COUNT", queries[0])
+
+    def test_not_selected(self):
+        data, queries = self._get("/api/skill_stats/users/", {"aggressive": 1, "return_fields": "id,username"})
+        self.assertNotIn("COUNT", queries[0])
+
+    def test_multiple_aggregates(self):
+        # skills x groups are joined
+        from .models import User, Group
+        Group.objects.create(name="magik").user_set.add(User.objects.get())
+        params = {"aggressive": 1, "return_fields": "username,skill_count,n_skills,n_groups"}
+        data, queries = self._get("/api/skill_stats/users/", params)
+        self.assertEqual(data, [{"username": "admin", "skill_count": 2, "n_skills": 2, "n_groups": 2}])
+        self.assertEqual(len(queries), 1)
+
+    def test_not_distinct_count(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from django.db.models import Count
+        from django_returnfields import depends
+        from django_returnfields.fields import AggregateField
+        with self.assertRaises(ImproperlyConfigured):
+            AggregateField(Count("skills"))
+        with self.assertRaises(ImproperlyConfigured):
+            depends(annotate={"n": Count("skills") + 1})
+
+    def test_skipped(self):
+        data, queries = self._get("/api/skill_stats/users/", {"aggressive": 1, "skip_fields": "n_skills,n_groups,skill_count,skill_names"})
+        self.assertNotIn("n_skills", data[0])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("COUNT", queries[0])
+
+    def test_nested(self):
+        data, queries = self._get("/api/skill_stats/groups/", {"aggressive": 1, "return_fields": "name,users__n_skills"})
+        self.assertEqual(data, [{"name": "magic", "users": [{"n_skills": 2}]}])
+        self.assertEqual(len(queries), 2)
+
+    def test_without_aggressive(self):
+        data, _ = self._get("/api/skill_stats/users/", {"return_fields": "username,n_skills"})
+        self.assertEqual(data, [{"username": "admin", "n_skills": 2}])
+
+    def test_without_aggressive__aggregated_by_one_query(self):
+        from .models import User, Skill
+        for i in range(3):
+            user = User.objects.create_user('user{}'.format(i), 'user{}@test.com'.format(i), '')
+            Skill.objects.create(user=user, name="magic")
+        data, queries = self._get("/api/skill_stats/users/", {"return_fields": "username,n_skills,n_groups"})
+        self.assertEqual([row["n_skills"] for row in data], [2, 1, 1, 1])
+        self.assertEqual([row["n_groups"] for row in data], [1, 0, 0, 0])
+        self.assertEqual(len(queries), 2)  # users, aggregates
+
+    def test_without_aggressive__nested(self):
+        data, queries = self._get("/api/skill_stats/groups/", {"return_fields": "name,users__n_skills"})
+        self.assertEqual(data, [{"name": "magic", "users": [{"n_skills": 2}]}])
+        self.assertEqual(len(queries), 3)  # groups, users, aggregates
@@ -338,3 +338,61 @@ class CollectAllContextualNestedTests(TestCase):
         actual = translator.translate(self.Serializer, None, context)
         expected = ['id', 'username', 'skills__id', 'skills__user__id', 'skills__user__url', 'skills__user__username', 'skills__user__email', 'skills__user__is_staff', 'skills__name']
         self.assertEqual(actual, expected)
+
+
+class TranslationIndexTests(TestCase):
+    def _makeTranslator(self):
+        from django_returnfields.optimize import NameListTranslator
+        return NameListTranslator()
+
+    def test_static_tokens_are_precomputed(self):
+        index = self._makeTranslator().get_index(s.SkillSerializer)
+        self.assertEqual(index.entries["user"], ('user__id', 'user__url', 'user__username', 'user__email', 'user__is_staff'))
+        self.assertEqual(index.plain_entries, [('id', 'user__id', 'user__url', 'user__username', 'user__email', 'user__is_staff', 'name')])
+
+    def test_dynamic_tokens_are_evaluated_per_request(self):
+        from django_returnfields import contextual
+        from .models import User
+
+        class ContextualUserSerializer(serializers.ModelSerializer):
+            username = serializers.SerializerMethodField()
+
+            class Meta:
+                model = User
+                fields = ('id', 'username')
+
+            @contextual(lambda token, context: ["username"] if "with_username" in context else [])
+            def get_username(self, ob):
+                return ob.username
+
+        translator = self._makeTranslator()
+        index = translator.get_index(ContextualUserSerializer)
+        self.assertEqual(index.entries["id"], ("id", ))
+        self.assertTrue(callable(index.entries["username"]))
+        self.assertEqual(translator.translate(ContextualUserSerializer, ["id", "username"], {}), ["id"])
+        self.assertEqual(translator.translate(ContextualUserSerializer, ["id", "username"], {"with_username": True}), ["id", "username"])
+
+    def test_related_token(self):
+        translator = self._makeTranslator()
+        self.assertEqual(
+            translator.translate(s.GroupUserSerializer, ["groups"], {}),
+            ['groups__id', 'groups__name', 'groups__permissions__id']
+        )
+
+    def test_classes_are_not_kept_alive(self):
+        import gc
+        from django.contrib.auth.models import User
+
+        class TemporaryUserSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = User
+                fields = ('id', 'username')
+
+        translator = self._makeTranslator()
+        translator.translate(TemporaryUserSerializer, ["id"], {})
+        translator.single_valued_paths(TemporaryUserSerializer)
+        self.assertEqual(len(translator.index_cache), 1)
+        del TemporaryUserSerializer
+        gc.collect()
+        for cache in (translator.fields_cache, translator.mapping_cache, translator.paths_cache, translator.index_cache):
+            self.assertEqual(len(cache), 0)
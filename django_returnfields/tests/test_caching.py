@@ -0,0 +1,217 @@
+# -*- coding:utf-8 -*-
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APITestCase
+from .models import User
+
+
+class ResponseCacheTests(APITestCase):
+    # see: ./url:CachedSkillUserViewSet
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(3):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def _get(self, path):
+        response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_canonical_selection(self):
+        first = self._get("/api/cached/skill_users/?return_fields=id,username")
+        with self.assertNumQueries(0):
+            second = self._get("/api/cached/skill_users/?return_fields=username,id,id")
+        self.assertEqual(second, first)
+        self.assertEqual(set(second[0].keys()), {"id", "username"})
+
+    def test_another_selection(self):
+        self._get("/api/cached/skill_users/?return_fields=id,username")
+        with self.assertNumQueries(2):
+            data = self._get("/api/cached/skill_users/?return_fields=id,skills&aggressive=1")
+        self.assertEqual(set(data[0].keys()), {"id", "skills"})
+
+    def test_another_params(self):
+        self._get("/api/cached/skill_users/?return_fields=id")
+        with self.assertNumQueries(1):
+            self._get("/api/cached/skill_users/?return_fields=id&format=json")
+
+    def test_retrieve(self):
+        pk = User.objects.get(username="admin1").pk
+        path = "/api/cached/skill_users/{}/?return_fields=username".format(pk)
+        self.assertEqual(self._get(path), {"username": "admin1"})
+        with self.assertNumQueries(1):  # looking up the object
+            self.assertEqual(self._get(path), {"username": "admin1"})
+
+    def test_retrieve__object_permissions(self):
+        from unittest import mock
+        from rest_framework.exceptions import PermissionDenied
+        from .viewsets import CachedSkillUserViewSet
+        pk = User.objects.get(username="admin1").pk
+        path = "/api/cached/skill_users/{}/?return_fields=username".format(pk)
+        self._get(path)
+        with mock.patch.object(CachedSkillUserViewSet, "check_object_permissions", side_effect=PermissionDenied):
+            response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_per_user(self):
+        path = "/api/cached/skill_users/?return_fields=id"
+        self._get(path)
+        with self.assertNumQueries(0):
+            self._get(path)
+        self.client.force_authenticate(User.objects.get(username="admin0"))
+        with self.assertNumQueries(1):
+            self._get(path)
+
+    def test_models_of_nested_serializers(self):
+        from .models import Skill
+        from .viewsets import CachedSkillUserViewSet
+        view = CachedSkillUserViewSet()
+        self.assertEqual(view.get_response_cache_models(), (User, Skill))
+
+    def test_invalidated_by_signal(self):
+        from .models import Skill
+        path = "/api/cached/skill_users/?return_fields=skills__name"
+        self._get(path)
+        Skill.objects.filter(name="magik").first().delete()
+        data = self._get(path)
+        self.assertEqual(sum(len(row["skills"]) for row in data), 5)
+
+        user = User.objects.get(username="admin0")
+        user.username = "updated"
+        user.save()
+        data = self._get("/api/cached/skill_users/?return_fields=username")
+        self.assertEqual(data[0]["username"], "updated")
+
+    def test_invalidated_by_write_before_first_read(self):
+        from django.db.models import signals
+        from django_returnfields import caching
+        from django_returnfields.apps import connect_urlconf_response_caches
+        from .models import Skill
+        from .viewsets import CachedSkillUserViewSet
+
+        # the state of a fresh process, nothing is connected
+        for model in (User, Skill):
+            uid = "{}:invalidate:{}:default".format(caching.KEY_PREFIX, model._meta.label_lower)
+            signals.post_save.disconnect(sender=model, dispatch_uid=uid)
+            signals.post_delete.disconnect(sender=model, dispatch_uid=uid)
+        caching._connected.clear()
+
+        self.assertIn(CachedSkillUserViewSet, connect_urlconf_response_caches())  # AppConfig.ready()
+        Skill.objects.filter(name="magik").first().delete()
+        self.assertEqual(caches["default"].get(caching.get_version_key(Skill)), 1)
+
+
+class ConditionalGetTests(APITestCase):
+    # see: ./url:ConditionalSkillUserViewSet
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(3):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def test_not_modified(self):
+        from unittest import mock
+        path = "/api/conditional/skill_users/?return_fields=username,skills__name&aggressive=1"
+        first = self.client.get(path, format="json")
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+
+        with mock.patch("django_returnfields.Restriction.to_representation") as m:
+            m.side_effect = AssertionError("don't serialize it!")
+            with self.assertNumQueries(2):  # users, skills (only selected columns)
+                second = self.client.get(path, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], etag)
+
+    def test_same_as_default_rendering(self):
+        path = "?return_fields=username,skills__name&aggressive=1"
+        response = self.client.get("/api/conditional/skill_users/" + path, format="json")
+        self.assertEqual(response.data, self.client.get("/api/skill_users/" + path, format="json").data)
+
+    def test_modified(self):
+        from .models import Skill
+        path = "/api/conditional/skill_users/?return_fields=username,skills__name&aggressive=1"
+        etag = self.client.get(path, format="json")["ETag"]
+
+        Skill.objects.filter(name="magik").update(name="magick")
+        response = self.client.get(path, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_not_selected_columns_are_not_concerned(self):
+        path = "/api/conditional/skill_users/?return_fields=username&aggressive=1"
+        etag = self.client.get(path, format="json")["ETag"]
+        User.objects.update(email="changed@test.com")
+        self.assertEqual(self.client.get(path, format="json", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_another_selection(self):
+        etag = self.client.get("/api/conditional/skill_users/?return_fields=id&aggressive=1", format="json")["ETag"]
+        response = self.client.get("/api/conditional/skill_users/?return_fields=id,username&aggressive=1", format="json")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_retrieve(self):
+        pk = User.objects.get(username="admin1").pk
+        path = "/api/conditional/skill_users/{}/?return_fields=username,skills__name&aggressive=1".format(pk)
+        response = self.client.get(path, format="json")
+        self.assertEqual(response.data, {"username": "admin1", "skills": [{"name": "magic"}, {"name": "magik"}]})
+        self.assertEqual(self.client.get(path, format="json", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        response = self.client.get("/api/conditional/skill_users/0/?aggressive=1", format="json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_retrieve__rendered_as_single_object(self):
+        from unittest import mock
+        from .viewsets import ConditionalSkillUserViewSet
+        pk = User.objects.get(username="admin1").pk
+        path = "/api/conditional/skill_users/{}/?return_fields=username,skills__name&aggressive=1".format(pk)
+        serializer_class = ConditionalSkillUserViewSet.serializer_class
+        with mock.patch.object(serializer_class, "many_init", side_effect=AssertionError("not rendered as a list")):
+            with self.assertNumQueries(2):  # the user, skills
+                response = self.client.get(path, format="json")
+        self.assertEqual(response.data, {"username": "admin1", "skills": [{"name": "magic"}, {"name": "magik"}]})
+
+    def test_paginated(self):
+        path = "/api/conditional_paginated/skill_users/?return_fields=username&aggressive=1&page_size=2"
+        response = self.client.get(path, format="json")
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(len(response.data["results"]), 2)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(path, format="json", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        User.objects.create_superuser('admin3', 'myemail3@test.com', '')  # count is changed
+        self.assertEqual(self.client.get(path, format="json", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_without_aggressive(self):
+        response = self.client.get("/api/conditional/skill_users/?return_fields=username", format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+
+    def test_modified__select_related(self):
+        path = "/api/conditional/skills/?return_fields=name,user__username&aggressive=1"
+        etag = self.client.get(path, format="json")["ETag"]
+        User.objects.filter(username="admin1").update(username="updated")
+        response = self.client.get(path, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class UpdateDigestTests(TestCase):
+    def _callFUT(self, ob):
+        import hashlib
+        from django_returnfields.caching import update_digest
+        return update_digest(hashlib.sha1(), ob).hexdigest()
+
+    def test_fields_cache(self):
+        # django >= 2.0 stores select_related objects in _state.fields_cache
+        from .models import Skill
+        skill = Skill(pk=1, name="magic")
+        skill._state.fields_cache = {"user": User(pk=1, username="admin")}
+        digest = self._callFUT(skill)
+        skill._state.fields_cache["user"].username = "updated"
+        self.assertNotEqual(self._callFUT(skill), digest)
@@ -0,0 +1,33 @@
+# -*- coding:utf-8 -*-
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+
+
+class WarmupCommandTests(TestCase):
+    def test_it(self):
+        from rest_framework import serializers
+        from django_returnfields import serializer_factory
+
+        class LazySerializer(serializers.Serializer):
+            name = serializers.CharField()
+        serializer_factory(LazySerializer, lazy=True)
+
+        out = StringIO()
+        call_command("returnfields_warmup", stdout=out)
+        self.assertIn("serializers are upgraded", out.getvalue())
+        self.assertNotIn("0 serializers", out.getvalue())
+
+
+class ExplainCommandTests(TestCase):
+    def test_it(self):
+        import json
+        out = StringIO()
+        call_command(
+            "returnfields_explain", "django_returnfields.tests.serializers.SkillUserSerializer",
+            "--return-fields=username,skills__name", stdout=out
+        )
+        result = json.loads(out.getvalue())
+        self.assertTrue(result["optimized"])
+        self.assertEqual(result["selection"]["name_list"], ["username", "skills__name"])
+        self.assertEqual([x["lookup"] for x in result["explain"]], ["", "skills"])
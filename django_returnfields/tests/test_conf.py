@@ -0,0 +1,105 @@
+# -*- coding:utf-8 -*-
+import unittest
+from rest_framework.test import APITestCase
+from .models import User
+
+
+class LoadSettingsTests(unittest.TestCase):
+    def _callFUT(self, options):
+        from django_returnfields.conf import load_settings
+        return load_settings(options)
+
+    def test_defaults(self):
+        settings = self._callFUT({})
+        self.assertEqual(settings.INCLUDE_KEY, "return_fields")
+        self.assertFalse(settings.AGGRESSIVE)
+
+    def test_override(self):
+        settings = self._callFUT({"AGGRESSIVE": True, "PLAN_CACHE_SIZE": 128})
+        self.assertTrue(settings.AGGRESSIVE)
+        self.assertEqual(settings.PLAN_CACHE_SIZE, 128)
+        self.assertEqual(settings.MAX_FIELDS, 256)
+
+    def test_unknown_key(self):
+        from django.core.exceptions import ImproperlyConfigured
+        with self.assertRaises(ImproperlyConfigured):
+            self._callFUT({"AGGRESIVE": True})
+
+    def test_sinks(self):
+        from django_returnfields.conf import get_sinks
+        from django_returnfields.instrumentation import LoggingSink, HeaderSink
+        fn = lambda metrics, request, response: None
+        settings = self._callFUT({"INSTRUMENTATION_SINKS": ["django_returnfields.instrumentation.HeaderSink", LoggingSink, fn]})
+        sinks = get_sinks(settings)
+        self.assertIsInstance(sinks[0], HeaderSink)
+        self.assertIsInstance(sinks[1], LoggingSink)
+        self.assertIs(sinks[2], fn)
+        self.assertIsNone(get_sinks(self._callFUT({})))
+
+
+class ViewOptionTests(unittest.TestCase):
+    def _callFUT(self, view, name, default):
+        from django_returnfields.conf import get_view_option
+        return get_view_option(view, name, default)
+
+    def test_it(self):
+        class view:
+            returnfields_settings = {"AGGRESSIVE": True}
+        self.assertTrue(self._callFUT(view, "AGGRESSIVE", False))
+        self.assertEqual(self._callFUT(view, "MAX_FIELDS", 10), 10)
+        self.assertEqual(self._callFUT(None, "MAX_FIELDS", 10), 10)
+
+
+class ConfiguredViewTests(APITestCase):
+    # see: ./url:ConfiguredSkillUserViewSet
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(3):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def test_aggressive_by_default(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/configured/skill_users/?return_fields=username,skills__name", format="json")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/configured/skill_users/", format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data[0].keys()), {"id", "username", "skills"})
+
+    def test_max_fields(self):
+        response = self.client.get("/api/configured/skill_users/?return_fields=id,username,skills", format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class OverrideSettingsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(3):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def test_settings_are_read_lazily(self):
+        from django.test import override_settings
+        from django_returnfields.conf import returnfields_settings
+        with override_settings(RETURNFIELDS={"MAX_DEPTH": 3}):
+            self.assertEqual(returnfields_settings.MAX_DEPTH, 3)
+        self.assertEqual(returnfields_settings.MAX_DEPTH, 10)
+
+    def test_aggressive(self):
+        from django.test import override_settings
+        path = "/api/skill_users/?return_fields=username,skills__name"
+        with override_settings(RETURNFIELDS={"AGGRESSIVE": True}):
+            with self.assertNumQueries(2):
+                response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(4):  # N+1
+            self.client.get(path, format="json")
+
+    def test_max_fields(self):
+        from django.test import override_settings
+        with override_settings(RETURNFIELDS={"MAX_FIELDS": 1}):
+            response = self.client.get("/api/skill_users/?return_fields=id,username", format="json")
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,55 @@
+# -*- coding:utf-8 -*-
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+
+class ExplainMixinTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import User, Skill
+        cls.user = User.objects.create_superuser('admin', 'myemail@test.com', '')
+        Skill.objects.create(user=cls.user, name="magic")
+
+    @override_settings(DEBUG=True)
+    def test_list(self):
+        params = {"explain": 1, "aggressive": 1, "return_fields": "username,skills__name"}
+        response = self.client.get("/api/explain/skill_users/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["optimized"])
+        self.assertEqual(response.data["plan"]["only"], ["username"])
+        self.assertEqual(response.data["plan"]["prefetch_related"][0]["lookup"], "skills")
+        self.assertEqual(len(response.data["queries"]), 2)
+        self.assertEqual(len(response.data["explain"]), 2)
+        self.assertEqual(response.data["count"], 1)
+
+    @override_settings(DEBUG=True)
+    def test_retrieve(self):
+        path = "/api/explain/skill_users/{}/".format(self.user.pk)
+        response = self.client.get(path, {"explain": 1, "aggressive": 1, "return_fields": "username"})
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(len(response.data["queries"]), 1)
+
+    @override_settings(DEBUG=True)
+    def test_retrieve__not_found(self):
+        response = self.client.get("/api/explain/skill_users/0/", {"explain": 1})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(DEBUG=True)
+    def test_retrieve__object_permissions(self):
+        from unittest import mock
+        from rest_framework.exceptions import PermissionDenied
+        from .viewsets import ExplainSkillUserViewSet
+        path = "/api/explain/skill_users/{}/".format(self.user.pk)
+        with mock.patch.object(ExplainSkillUserViewSet, "check_object_permissions", side_effect=PermissionDenied):
+            response = self.client.get(path, {"explain": 1})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(DEBUG=True)
+    def test_not_optimized(self):
+        response = self.client.get("/api/explain/skill_users/", {"explain": 1})
+        self.assertFalse(response.data["optimized"])
+        self.assertIsNone(response.data["selection"])
+
+    def test_disabled_without_debug(self):
+        response = self.client.get("/api/explain/skill_users/", {"explain": 1, "return_fields": "username"})
+        self.assertEqual(response.data, [{"username": "admin"}])
@@ -73,3 +73,175 @@ class SerializerDumpTests(unittest.TestCase):
 
         actual = json.dumps(result)
         self.assertEqual(actual, expected)
+
+    def test_it__filtering__restricted_fields_are_cached(self):
+        from django_returnfields import serializer_factory, restriction_factory
+        restriction = restriction_factory()
+        Serializer = serializer_factory(self._makeSerializer(), restriction=restriction)
+
+        articles = [self._makeArticle(), self._makeArticle()]
+        request = self._makeDummyRequest({"skip_fields": "content,comments__content"})
+        Serializer(articles, context={"request": request}, many=True).data
+        self.assertEqual(restriction.fields_cache.info().hits, 0)
+
+        request = self._makeDummyRequest({"skip_fields": "comments__content,content,content"})
+        result = Serializer(articles, context={"request": request}, many=True).data
+        self.assertEqual(restriction.fields_cache.info().hits, 2)  # article, comment
+
+        expected = '[{"name": "hello", "comments": [{"name": "title0"}, {"name": "title1"}, {"name": "title2"}]}, {"name": "hello", "comments": [{"name": "title0"}, {"name": "title1"}, {"name": "title2"}]}]'  # NOQA
+        self.assertEqual(json.dumps(result), expected)
+
+    def test_it__filtering__fields_changed_per_request(self):
+        from django_returnfields import serializer_factory, restriction_factory
+
+        class ArticleSerializer(serializers.Serializer):
+            name = serializers.CharField()
+            content = serializers.CharField()
+
+            def get_fields(self):
+                fields = super(ArticleSerializer, self).get_fields()
+                if not self.context.get("is_staff"):
+                    fields.pop("content")
+                return fields
+        Serializer = serializer_factory(ArticleSerializer, restriction=restriction_factory())
+
+        request = self._makeDummyRequest({"return_fields": "name,content"})
+        result = Serializer(self._makeArticle(), context={"request": request, "is_staff": True}).data
+        self.assertEqual(json.dumps(result), '{"name": "hello", "content": "hello world"}')
+        result = Serializer(self._makeArticle(), context={"request": request}).data
+        self.assertEqual(json.dumps(result), '{"name": "hello"}')
+
+    def test_it__filtering__cache_key(self):
+        from django_returnfields import serializer_factory, restriction_factory
+        restriction = restriction_factory()
+        Serializer = serializer_factory(self._makeSerializer(), restriction=restriction)
+        request = self._makeDummyRequest({"skip_fields": "content,comments__content"})
+        Serializer(self._makeArticle(), context={"request": request}).data
+        # the field names are not in the key, get_fields() is not overridden
+        self.assertTrue(all(len(k) == 2 for k in restriction.fields_cache.keys()))
+
+    def test_it__filtering__child_selections_are_computed_once_per_request(self):
+        from unittest import mock
+        from django_returnfields.selection import FieldSelection
+        Serializer = self._makeOne(self._makeSerializer())
+        request = self._makeDummyRequest({"skip_fields": "content,comments__content"})
+
+        counts = []
+        for n in (2, 20):
+            articles = [self._makeArticle() for _ in range(n)]
+            with mock.patch.object(FieldSelection, "child", autospec=True, side_effect=FieldSelection.child) as m:
+                Serializer(articles, context={"request": request}, many=True).data
+            counts.append(m.call_count)
+        self.assertEqual(counts[0], counts[1])
+
+
+class LazySerializerFactoryTests(unittest.TestCase):
+    def _makeOne(self, serializer_class):
+        from django_returnfields import serializer_factory
+        return serializer_factory(serializer_class, lazy=True)
+
+    def _makeSerializer(self):
+        class CommentSerializer(serializers.Serializer):
+            name = serializers.CharField()
+
+        class ArticleSerializer(serializers.Serializer):
+            name = serializers.CharField()
+            comments = CommentSerializer(many=True)
+        return ArticleSerializer
+
+    def test_upgraded_on_first_instantiation(self):
+        from django_returnfields import is_already_upgraded
+        base = self._makeSerializer()
+        Serializer = self._makeOne(base)
+        self.assertFalse(is_already_upgraded(base._declared_fields["comments"].child.__class__))
+
+        Serializer(many=True)
+        self.assertTrue(is_already_upgraded(base._declared_fields["comments"].child.__class__))
+        self.assertTrue(is_already_upgraded(Serializer.Meta.list_serializer_class))
+
+    def test_warmup(self):
+        from django_returnfields import is_already_upgraded, warmup
+        base = self._makeSerializer()
+        self._makeOne(base)
+        self.assertGreaterEqual(warmup(), 1)
+        self.assertTrue(is_already_upgraded(base._declared_fields["comments"].child.__class__))
+        self.assertEqual(warmup(), 0)
+
+    def test_filtering(self):
+        Serializer = self._makeOne(self._makeSerializer())
+        article = Article("hello", "", [Comment("title0", "hmm")])
+
+        class request:
+            GET = {"return_fields": "comments__name"}
+        result = Serializer(article, context={"request": request}).data
+        self.assertEqual(json.dumps(result), '{"comments": [{"name": "title0"}]}')
+
+
+class SerializerRegistryTests(unittest.TestCase):
+    def setUp(self):
+        from django_returnfields import clear_registry
+        clear_registry()
+
+    def _callFUT(self, serializer_class, restriction):
+        from django_returnfields import serializer_factory
+        return serializer_factory(serializer_class, restriction=restriction)
+
+    def _makeSerializer(self):
+        class CommentSerializer(serializers.Serializer):
+            name = serializers.CharField()
+        return CommentSerializer
+
+    def test_cached(self):
+        from django_returnfields import restriction_factory, registry_info
+        restriction = restriction_factory(include_key="return_fields", exclude_key="skip_fields")
+        base = self._makeSerializer()
+        Serializer = self._callFUT(base, restriction)
+        self.assertIs(self._callFUT(base, restriction), Serializer)
+        self.assertEqual(registry_info().hits, 1)
+
+    def test_restrictions_having_same_options_are_not_shared(self):
+        from django_returnfields import restriction_factory
+        base = self._makeSerializer()
+        restriction0 = restriction_factory(include_key="return_fields", exclude_key="skip_fields")
+        restriction1 = restriction_factory(include_key="return_fields", exclude_key="skip_fields")
+        self.assertIsNot(self._callFUT(base, restriction0), self._callFUT(base, restriction1))
+
+    def test_concurrent_creation(self):
+        import threading
+        from django_returnfields import restriction_factory
+        restriction = restriction_factory(include_key="return_fields", exclude_key="skip_fields")
+        base = self._makeSerializer()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self._callFUT(base, restriction))) for _ in range(8)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertEqual(len(set(results)), 1)
+
+
+class PrecompileTests(unittest.TestCase):
+    def setUp(self):
+        from django_returnfields import clear_registry
+        clear_registry()
+
+    def _callFUT(self):
+        from django_returnfields import precompile
+        return precompile()
+
+    def test_it(self):
+        from django_returnfields import serializer_factory
+        from django_returnfields.optimize import default_translator
+
+        class CommentSerializer(serializers.Serializer):
+            name = serializers.CharField()
+        Serializer = serializer_factory(CommentSerializer)
+
+        self.assertEqual(self._callFUT(), 1)
+        self.assertIn(Serializer, default_translator.mapping_cache)
+
+    def test_translator_is_shared(self):
+        from django_returnfields import restriction_factory
+        restriction0 = restriction_factory(include_key="return_fields", exclude_key="skip_fields")
+        restriction1 = restriction_factory(include_key="return_fields", exclude_key="skip_fields")
+        self.assertIs(restriction0.query_optimizer.translator, restriction1.query_optimizer.translator)
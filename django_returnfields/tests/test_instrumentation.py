@@ -0,0 +1,77 @@
+# -*- coding:utf-8 -*-
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+from django_returnfields.instrumentation import InstrumentationMiddleware, HeaderSink, CallbackSink
+from .models import User
+
+recorded = []
+
+
+class RecordingMiddleware(InstrumentationMiddleware):
+    @staticmethod
+    def get_sinks():
+        return [HeaderSink(), CallbackSink(lambda name, value: recorded.append((name, value)))]
+
+
+class QueryRecorderTests(TestCase):
+    def tearDown(self):
+        from django_returnfields import instrumentation
+        instrumentation.deactivate()
+
+    def test_it(self):
+        from django_returnfields import instrumentation
+        metrics = instrumentation.activate()
+        recorder = instrumentation.QueryRecorder(metrics)
+        recorder.start()
+        list(User.objects.all())
+        User.objects.count()
+        recorder.stop()
+        self.assertEqual(metrics.query_count, 2)
+
+    def test_measure__deactivated(self):
+        from django_returnfields import instrumentation
+        with instrumentation.measure(instrumentation.SETUP) as metrics:
+            pass
+        self.assertIsNone(metrics)
+
+    def test_measure__exclusive(self):
+        from django_returnfields import instrumentation
+        metrics = instrumentation.activate()
+        with instrumentation.measure(instrumentation.SERIALIZATION):
+            with instrumentation.measure(instrumentation.RESTRICTION):
+                metrics.add(instrumentation.SQL, 10.0)  # recorded while restricting
+        self.assertEqual(metrics.timings[instrumentation.SQL], 10.0)
+        self.assertLess(metrics.timings[instrumentation.RESTRICTION], 1.0)
+        self.assertLess(metrics.timings[instrumentation.SERIALIZATION], 1.0)
+        self.assertGreaterEqual(metrics.timings[instrumentation.SERIALIZATION], 0.0)
+
+
+@override_settings(MIDDLEWARE_CLASSES=[
+    "django.middleware.common.CommonMiddleware",
+    "django_returnfields.tests.test_instrumentation.RecordingMiddleware",
+])
+class InstrumentationMiddlewareTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(3):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def setUp(self):
+        del recorded[:]
+
+    def test_it(self):
+        path = "/api/skill_users/?return_fields=id,skills__name&aggressive=1"
+        response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        header = response["Server-Timing"]
+        for phase in ["setup", "restriction", "optimization", "sql", "serialization"]:
+            self.assertIn("drf-{};dur=".format(phase), header)
+        self.assertIn('"2 queries"', header)
+
+        d = dict(recorded)
+        self.assertEqual(d["returnfields.query_count"], 2)
+        self.assertEqual(d["returnfields.rows"], 3)
+        self.assertGreater(d["returnfields.serialization"], 0.0)
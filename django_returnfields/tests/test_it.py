@@ -42,6 +42,13 @@ class RestrictFeatureTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
         self.assertNotEqual(set(response.data[0].keys()), {"username"})
 
+    def test_restricted__too_many_fields(self):
+        from django_returnfields.conf import returnfields_settings
+        max_fields = returnfields_settings.MAX_FIELDS
+        path = "/api/users/?return_fields={}".format(",".join("f{}".format(i) for i in range(max_fields + 1)))
+        response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, msg=extract_error_message(response))
+
     def test_restricted__exclude(self):
         path = "/api/users/?skip_fields=username,url,email"
         response = self.client.get(path, format="json")
@@ -268,6 +275,107 @@ class PaginatedViewTests(APITestCase):
             self.assertEqual([u["id"]for u in response.data['results']], [6, 5, 4, 3, 2], msg="*order by id desc")
 
 
+class AggressivePaginatedViewTests(APITestCase):
+    # see: ./url:SkillUserAggressivePaginatedViewSet
+    @classmethod
+    def setUpTestData(self):
+        from .models import Skill
+        for i in range(6):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([
+                Skill(user=user, name="dummy"), Skill(user=user, name="magic"), Skill(user=user, name="magik")
+            ])
+
+    def test_listing__without_paramater__feature_is_deactivated(self):
+        path = "/api/aggressive_paginated/skill_users/?page_size=5"
+        with self.assertNumQueries(7):
+            response = self.client.get(path, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+            self.assertEqual(len(response.data["results"]), 5)
+            self.assertEqual(len(response.data["results"][0]["skills"]), 3)  # dummy, magic, magik
+
+    def test_listing__pagination(self):
+        path = "/api/aggressive_paginated/skill_users/?aggressive=1&page_size=5"
+        with self.assertNumQueries(3, msg="count, page, prefetch (the page is not fetched twice)"):
+            response = self.client.get(path, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+            self.assertEqual(response.data["count"], 6)
+            self.assertEqual(len(response.data["results"]), 5, msg="*paginated")
+            self.assertEqual(set(response.data["results"][0].keys()), {'id', 'skills', 'username'})
+            self.assertEqual(len(response.data["results"][0]["skills"]), 2, "*prefetch_filter() is activated")
+
+    def test_listing__pagination__ordered(self):
+        path = "/api/aggressive_paginated/skill_users/?aggressive=1&page_size=5&ordering=-id&return_fields=id"
+        with self.assertNumQueries(2):
+            response = self.client.get(path, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+            self.assertEqual([u["id"]for u in response.data['results']], [6, 5, 4, 3, 2], msg="*order by id desc")
+
+    def test_listing__pagination__last_page(self):
+        path = "/api/aggressive_paginated/skill_users/?aggressive=1&page_size=5&page=2&return_fields=id"
+        response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+        self.assertEqual([u["id"]for u in response.data['results']], [6])
+
+
+class PlanCachedViewTests(APITestCase):
+    # see: ./url:SkillUserPlanCachedPaginatedViewSet
+    @classmethod
+    def setUpTestData(self):
+        from .models import Skill
+        for i in range(6):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([
+                Skill(user=user, name="dummy"), Skill(user=user, name="magic"), Skill(user=user, name="magik")
+            ])
+
+    def setUp(self):
+        from .viewsets import plan_cached_restriction
+        self.query_optimizer = plan_cached_restriction.query_optimizer
+        self.query_optimizer.invalidate_plans()
+
+    def test_replayed(self):
+        path = "/api/plan_cached/skill_users/?aggressive=1&page_size=5&return_fields=username,skills__name"
+        first = self.client.get(path, format="json")
+        self.assertEqual(first.status_code, status.HTTP_200_OK, msg=extract_error_message(first))
+
+        with self.assertNumQueries(4):
+            with mock.patch("django_returnfields.optimize.aggressive.aggressive_query") as m:
+                m.side_effect = AssertionError("don't call it!")
+                second = self.client.get(path, format="json")
+        self.assertEqual(second.status_code, status.HTTP_200_OK, msg=extract_error_message(second))
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(len(second.data["results"][0]["skills"]), 2, "*prefetch_filter() is replayed")
+        self.assertEqual(self.query_optimizer.plan_cache.info().hits, 1)
+
+    def test_normalized(self):
+        self.client.get("/api/plan_cached/skill_users/?aggressive=1&return_fields=id,username", format="json")
+        self.client.get("/api/plan_cached/skill_users/?aggressive=1&return_fields=username,id,id", format="json")
+        self.assertEqual(self.query_optimizer.plan_cache.info().hits, 1)
+        self.assertEqual(len(self.query_optimizer.plan_cache), 1)
+
+    def test_hook_depending_on_request(self):
+        # see: ./url:OwnSkillUserPlanCachedViewSet, not cached without opting in
+        path = "/api/plan_cached/own_skill_users/?aggressive=1&return_fields=username,skills__name"
+        for username in ["admin0", "admin1"]:
+            user = User.objects.get(username=username)
+            self.client.force_authenticate(user)
+            response = self.client.get(path, format="json")
+            self.assertEqual(
+                [(row["username"], len(row["skills"])) for row in response.data if row["skills"]], [(username, 3)]
+            )
+        self.assertEqual(len(self.query_optimizer.plan_cache), 0)
+
+    def test_invalidate(self):
+        from . import serializers
+        from .viewsets import SkillUserPlanCachedPaginatedViewSet
+        self.client.get("/api/plan_cached/skill_users/?aggressive=1&return_fields=id", format="json")
+        self.query_optimizer.invalidate_plans(serializers.SkillOnlySerializer)
+        self.assertEqual(len(self.query_optimizer.plan_cache), 1)
+        self.query_optimizer.invalidate_plans(SkillUserPlanCachedPaginatedViewSet.serializer_class)
+        self.assertEqual(len(self.query_optimizer.plan_cache), 0)
+
+
 class ForceAggressivePaginatedViewTests(APITestCase):
     @classmethod
     def setUpTestData(self):
@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+from unittest import mock
+from rest_framework.test import APITestCase
+from rest_framework import status
+from .models import User
+
+
+def extract_error_message(response):
+    # this is utility function, when test is failed
+    return getattr(response, "data", None) or response.content
+
+
+class FlatRenderingTests(APITestCase):
+    # see: ./url:FlatSkillUserViewSet.serializer_class
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(3):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def test_flat(self):
+        path = "/api/flat/skill_users/?return_fields=id,username"
+        from django_returnfields.rendering import FlatRowRenderer
+        render = FlatRowRenderer.render
+        with mock.patch.object(FlatRowRenderer, "render", autospec=True, side_effect=render) as m:
+            with self.assertNumQueries(1):
+                response = self.client.get(path, format="json")
+        self.assertTrue(m.called)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+        expected = [{"id": 1, "username": "admin0"}, {"id": 2, "username": "admin1"}, {"id": 3, "username": "admin2"}]
+        self.assertEqual(response.data, expected)
+        self.assertEqual(list(response.data[0].keys()), ["id", "username"])
+
+    def test_flat__layout_is_cached(self):
+        from django_returnfields.rendering import FlatRowRenderer
+        path = "/api/flat/skill_users/?return_fields=username,is_staff"
+        compile = FlatRowRenderer.compile
+        with mock.patch.object(FlatRowRenderer, "compile", side_effect=compile) as m:
+            for _ in range(2):
+                response = self.client.get(path, format="json")
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(response.data[0], {"username": "admin0"})
+
+    def test_flat__same_as_default_rendering(self):
+        for qs in ["return_fields=username,id", "skip_fields=skills", "return_fields=id&aggressive=1"]:
+            flat = self.client.get("/api/flat/skill_users/?{}".format(qs), format="json")
+            default = self.client.get("/api/skill_users/?{}".format(qs), format="json")
+            self.assertEqual(flat.status_code, status.HTTP_200_OK, msg=extract_error_message(flat))
+            self.assertEqual(flat.data, default.data, msg=qs)
+
+    def test_nested__fallback(self):
+        path = "/api/flat/skill_users/?return_fields=id,skills__name"
+        with mock.patch("django_returnfields.rendering.FlatRowRenderer.render") as m:
+            response = self.client.get(path, format="json")
+        self.assertFalse(m.called)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+        self.assertEqual(response.data[0], {"id": 1, "skills": [{"name": "magic"}, {"name": "magik"}]})
+
+
+class ValuesEvaluationTests(APITestCase):
+    # see: ./url:ValuesSkillViewSet.serializer_class
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(3):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def test_aggressive(self):
+        from .models import Skill
+        expected = self.client.get("/api/values/skills/?return_fields=name,user", format="json").data
+
+        path = "/api/values/skills/?return_fields=name,user&aggressive=1"
+        with mock.patch.object(Skill, "from_db", side_effect=AssertionError("don't instantiate it!")):
+            with self.assertNumQueries(1):
+                response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+        self.assertEqual(response.data, expected)
+        self.assertEqual(response.data[0], {"name": "magic", "user": 1})
+
+    def test_without_aggressive(self):
+        with mock.patch("django_returnfields.rendering.FlatRowRenderer.render") as m:
+            response = self.client.get("/api/values/skills/?return_fields=id,user", format="json")
+        self.assertFalse(m.called)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=extract_error_message(response))
+
+    def test_render__from_instances(self):
+        from django_returnfields import serializer_factory
+        from django_returnfields.rendering import FlatRowRenderer
+        from .models import Skill
+        from .serializers import SkillWithUserIdSerializer
+        serializer = serializer_factory(SkillWithUserIdSerializer)()
+        renderer = FlatRowRenderer.from_serializer(serializer)
+        self.assertEqual(renderer.column_names, ["id", "name", "user"])
+
+        skills = list(Skill.objects.filter(name="magik").order_by("id"))
+        with self.assertNumQueries(0):
+            rows = renderer.render(skills)
+        self.assertEqual([row["user"] for row in rows], [s.user_id for s in skills])
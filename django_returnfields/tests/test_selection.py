@@ -0,0 +1,114 @@
+# -*- coding:utf-8 -*-
+import unittest
+
+
+class FieldSelectionTests(unittest.TestCase):
+    def _callFUT(self, includes, excludes):
+        from django_returnfields.selection import FieldSelection
+        return FieldSelection.compile(includes, excludes)
+
+    def _truncate(self, fields, field_name):
+        from django_returnfields import truncate_for_child
+        return tuple(truncate_for_child(list(fields), "{}__".format(field_name), field_name))
+
+    def test_toplevel(self):
+        from django_returnfields.constants import ALL
+        target = self._callFUT([ALL], ["id"])
+        self.assertTrue(target.include_all)
+        self.assertEqual(target.excluded_names, ("id", ))
+
+    def test_child__same_as_truncate_for_child(self):
+        from django_returnfields.constants import ALL
+        candidates = [
+            (["user", "user__id", "xxxx"], []),
+            (["skills__name", "username"], []),
+            (["skills"], ["skills__id"]),
+            (["groups__*", "groups"], ["id", "groups__permissions"]),
+            ([ALL], ["content", "comments__content"]),
+            (["a__b__c", "a__b", "a__d__e"], ["a__b__f"]),
+        ]
+        for includes, excludes in candidates:
+            target = self._callFUT(includes, excludes)
+            for name in ["user", "skills", "groups", "comments", "a", "xxxx", "username", "missing"]:
+                child = target.child(name)
+                self.assertEqual(child.includes, self._truncate(includes, name), msg=(includes, name))
+                self.assertEqual(child.excludes, self._truncate(excludes, name), msg=(excludes, name))
+
+    def test_grandchild(self):
+        target = self._callFUT(["a__b__c", "a__b", "a__d__e"], [])
+        child = target.child("a").child("b")
+        self.assertEqual(child.includes, ("c", ":all:"))
+        self.assertTrue(child.include_all)
+        self.assertEqual(target.child("a").included_names, frozenset(["b", "d"]))
+
+    def test_child__none_is_self(self):
+        target = self._callFUT(["id"], [])
+        self.assertIs(target.child(None), target)
+
+    def test_child__shared_default(self):
+        from django_returnfields.constants import ALL
+        target = self._callFUT([ALL], [])
+        self.assertIs(target.child("x"), target)
+        self.assertIs(target.child("x").child("y"), target)
+
+
+class FrameTests(unittest.TestCase):
+    def _makeOne(self, includes, excludes):
+        from django_returnfields.selection import Frame, FieldSelection
+        return Frame("", FieldSelection.compile(includes, excludes), toplevel=True)
+
+    def test_child(self):
+        target = self._makeOne(["a__b", "c"], [])
+        child = target.child("a")
+        self.assertEqual(child.name, "a")
+        self.assertFalse(child.toplevel)
+        self.assertIs(child.selection, target.selection.child("a"))
+
+    def test_child__shared(self):
+        target = self._makeOne(["a__b", "c"], [])
+        self.assertIs(target.child("a"), target.child("a"))
+        self.assertIs(target.child(None), target.child(None))
+        self.assertIsNot(target.child(None), target)
+
+
+class RequestValueTests(unittest.TestCase):
+    def _makeOne(self, **kwargs):
+        from django_returnfields import RequestValue
+        return RequestValue(**kwargs)
+
+    def _makeContext(self, d):
+        class request:
+            GET = d
+        return {"request": request}
+
+    def test_parse(self):
+        target = self._makeOne()
+        context = self._makeContext({"return_fields": "id, name,,skills__name, "})
+        self.assertEqual(target.parse(context, "return_fields"), ("id", "name", "skills__name"))
+        self.assertEqual(target.parse(context, "skip_fields"), ())
+
+    def test_parse__cached(self):
+        from unittest import mock
+        target = self._makeOne()
+        context = self._makeContext({"return_fields": "id,name"})
+        with mock.patch.object(target, "_parse", wraps=target._parse) as m:
+            target.parse(context, "return_fields")
+            target.parse(context, "return_fields")
+        self.assertEqual(m.call_count, 1)
+
+    def test_limits(self):
+        from django_returnfields.exceptions import InvalidSelection
+        candidates = [
+            ({"max_fields": 2}, "a,b,c"),
+            ({"max_depth": 2}, "a__b__c"),
+            ({"max_length": 4}, "a,b,c"),
+        ]
+        for kwargs, value in candidates:
+            target = self._makeOne(**kwargs)
+            with self.assertRaises(InvalidSelection, msg=kwargs):
+                target.parse(self._makeContext({"return_fields": value}), "return_fields")
+
+    def test_limits__ok(self):
+        target = self._makeOne(max_fields=3, max_depth=3, max_length=13)
+        context = self._makeContext({"return_fields": "a,b,c__d__e"})
+        self.assertEqual(target.parse(context, "return_fields"), ("a", "b", "c__d__e"))
@@ -0,0 +1,55 @@
+# -*- coding:utf-8 -*-
+import json
+from rest_framework.test import APITestCase
+from .models import User
+
+
+class StreamingListTests(APITestCase):
+    # see: ./url:StreamingSkillUserViewSet
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Skill
+        for i in range(5):
+            user = User.objects.create_superuser('admin{}'.format(i), 'myemail{}@test.com'.format(i), '')
+            Skill.objects.bulk_create([Skill(user=user, name="magic"), Skill(user=user, name="magik")])
+
+    def _get_streaming(self, path):
+        response = self.client.get(path, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b"".join(response.streaming_content).decode("utf-8"))
+
+    def test_same_as_default_rendering(self):
+        for qs in ["", "return_fields=username,skills__name", "skip_fields=skills&aggressive=1", "aggressive=1"]:
+            actual = self._get_streaming("/api/streaming/skill_users/?{}".format(qs))
+            expected = json.loads(json.dumps(self.client.get("/api/skill_users/?{}".format(qs), format="json").data))
+            self.assertEqual(actual, expected, msg=qs)
+
+    def test_aggressive__prefetch_per_chunk(self):
+        path = "/api/streaming/skill_users/?return_fields=id,skills__name&aggressive=1"
+        with self.assertNumQueries(1 + 3):  # users + skills for each chunk (chunk_size=2)
+            actual = self._get_streaming(path)
+        self.assertEqual(len(actual), 5)
+        self.assertEqual(actual[0], {"id": 1, "skills": [{"name": "magic"}, {"name": "magik"}]})
+
+    def test_empty(self):
+        User.objects.all().delete()
+        self.assertEqual(self._get_streaming("/api/streaming/skill_users/?aggressive=1"), [])
+
+    def test_not_json(self):
+        from unittest import mock
+        from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+        from .viewsets import StreamingSkillUserViewSet
+        view = StreamingSkillUserViewSet()
+        self.assertTrue(view.can_stream(mock.Mock(accepted_renderer=JSONRenderer())))
+        self.assertFalse(view.can_stream(mock.Mock(accepted_renderer=BrowsableAPIRenderer())))
+
+    def test_paginated(self):
+        from unittest import mock
+        from rest_framework.pagination import LimitOffsetPagination
+        from .viewsets import StreamingSkillUserViewSet
+        with mock.patch.object(StreamingSkillUserViewSet, "pagination_class", LimitOffsetPagination):
+            response = self.client.get("/api/streaming/skill_users/?return_fields=username&limit=2", format="json")
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(response.data["results"], [{"username": "admin0"}, {"username": "admin1"}])
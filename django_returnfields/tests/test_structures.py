@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+import unittest
+
+
+class LRUCacheTests(unittest.TestCase):
+    def _makeOne(self, maxsize):
+        from django_returnfields.structures import LRUCache
+        return LRUCache(maxsize=maxsize)
+
+    def test_it(self):
+        target = self._makeOne(2)
+        target.set("a", 1)
+        target.set("b", 2)
+        self.assertEqual(target.get("a"), 1)
+        target.set("c", 3)  # "b" is dropped
+        self.assertEqual(target.get("b"), None)
+        self.assertEqual(target.get("c"), 3)
+        self.assertEqual(tuple(target.info()), (2, 1, 2, 2))
+
+    def test_clear(self):
+        target = self._makeOne(2)
+        target.set("a", 1)
+        target.get("a")
+        target.clear()
+        self.assertEqual(tuple(target.info()), (0, 0, 2, 0))
+
+    def test_disabled(self):
+        target = self._makeOne(0)
+        target.set("a", 1)
+        self.assertEqual(len(target), 0)
+
+
+class ClassRegistryTests(unittest.TestCase):
+    def _makeOne(self, maxsize):
+        from django_returnfields.structures import ClassRegistry
+        return ClassRegistry(maxsize=maxsize)
+
+    def test_it(self):
+        target = self._makeOne(2)
+        A = target.set("a", type("A", (object, ), {}))
+        self.assertIs(target.get("a"), A)
+        self.assertIs(target.get("b"), None)
+        self.assertEqual(tuple(target.info()), (1, 1, 2, 1))
+
+    def test_unreferenced_classes_are_dropped(self):
+        import gc
+        target = self._makeOne(1)
+        target.set("a", type("A", (object, ), {}))
+        target.set("b", type("B", (object, ), {}))  # "a" is not pinned
+        gc.collect()
+        self.assertNotIn("a", target)
+        self.assertIn("b", target)
+
+    def test_referenced_classes_are_alive(self):
+        import gc
+        target = self._makeOne(0)
+        A = target.set("a", type("A", (object, ), {}))
+        gc.collect()
+        self.assertIs(target.get("a"), A)
+
+    def test_clear(self):
+        target = self._makeOne(2)
+        A = target.set("a", type("A", (object, ), {}))
+        target.get("a")
+        target.clear()
+        self.assertEqual(tuple(target.info()), (0, 0, 2, 0))
+        self.assertIsNotNone(A)
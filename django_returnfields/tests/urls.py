@@ -10,7 +10,23 @@ router.register(r'skill_users', viewsets.SkillUserViewSet)
 router.register(r'group_users', viewsets.GroupUserViewSet)
 router.register(r'skills', viewsets.SkillViewSet)
 router.register(r'paginated/skill_users', viewsets.SkillUserPaginatedViewSet)
+router.register(r'aggressive_paginated/skill_users', viewsets.SkillUserAggressivePaginatedViewSet)
+router.register(r'plan_cached/skill_users', viewsets.SkillUserPlanCachedPaginatedViewSet)
+router.register(r'plan_cached/own_skill_users', viewsets.OwnSkillUserPlanCachedViewSet)
 router.register(r'force_aggressive/skill_users', viewsets.SkillUserForceAggressiveViewSet)
+router.register(r'configured/skill_users', viewsets.ConfiguredSkillUserViewSet)
+router.register(r'flat/skill_users', viewsets.FlatSkillUserViewSet)
+router.register(r'values/skills', viewsets.ValuesSkillViewSet)
+router.register(r'streaming/skill_users', viewsets.StreamingSkillUserViewSet)
+router.register(r'cached/skill_users', viewsets.CachedSkillUserViewSet)
+router.register(r'conditional/skill_users', viewsets.ConditionalSkillUserViewSet)
+router.register(r'conditional/skills', viewsets.ConditionalSkillViewSet)
+router.register(r'conditional_paginated/skill_users', viewsets.ConditionalSkillUserPaginatedViewSet)
+router.register(r'aggressive_retrieve/skills', viewsets.AggressiveRetrieveSkillViewSet)
+router.register(r'skill_stats/users', viewsets.SkillStatsUserViewSet)
+router.register(r'skill_stats/groups', viewsets.SkillStatsGroupViewSet)
+router.register(r'skill_stats/magic_users', viewsets.MagicSkillUserViewSet)
+router.register(r'explain/skill_users', viewsets.ExplainSkillUserViewSet)
 
 urlpatterns = [
     url(r'^api/', include(router.urls)),
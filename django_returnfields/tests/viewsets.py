@@ -5,9 +5,14 @@ from rest_framework import pagination
 from rest_framework import filters
 
 from django_returnfields import serializer_factory, restriction_factory, ForceAggressiveRestriction
+from django_returnfields.streaming import StreamingListModelMixin
+from django_returnfields.pagination import AggressivePaginationMixin
+from django_returnfields.caching import ResponseCacheMixin, ConditionalGetMixin
+from django_returnfields.mixins import AggressiveRetrieveMixin
+from django_returnfields.diagnostics import ExplainMixin
 
 from . import serializers
-from .models import Skill
+from .models import Skill, Group
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -44,6 +49,26 @@ class SkillUserPaginatedViewSet(viewsets.ModelViewSet):
     pagination_class = MiniPagination
 
 
+class SkillUserAggressivePaginatedViewSet(AggressivePaginationMixin, SkillUserPaginatedViewSet):
+    pass
+
+
+plan_cached_restriction = restriction_factory(plan_cache_size=16)
+
+
+class SkillUserPlanCachedPaginatedViewSet(SkillUserPaginatedViewSet):
+    serializer_class = serializer_factory(serializers.SkillUserSerializer, restriction=plan_cached_restriction)
+    aggressive_plan_cacheable = True  # aggressive_queryset() doesn't depend on the request
+
+
+class OwnSkillUserPlanCachedViewSet(viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.SkillUserSerializer, restriction=plan_cached_restriction)
+
+    def aggressive_queryset(self, aqs):
+        return aqs.prefetch_filter(skills=lambda qs: qs.filter(user=self.request.user))
+
+
 class SkillUserForceAggressiveViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = serializer_factory(
@@ -52,6 +77,53 @@ class SkillUserForceAggressiveViewSet(viewsets.ModelViewSet):
     )
 
 
+class ConfiguredSkillUserViewSet(viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.SkillUserSerializer)
+    returnfields_settings = {"AGGRESSIVE": True, "MAX_FIELDS": 2}
+
+
+class FlatSkillUserViewSet(viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(
+        serializers.SkillUserSerializer,
+        restriction=restriction_factory(flat_rendering=True)
+    )
+
+
+class ValuesSkillViewSet(viewsets.ModelViewSet):
+    queryset = Skill.objects.all()
+    serializer_class = serializer_factory(
+        serializers.SkillWithUserIdSerializer,
+        restriction=restriction_factory(values_evaluation=True)
+    )
+
+
+class StreamingSkillUserViewSet(StreamingListModelMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.SkillUserSerializer)
+    streaming_chunk_size = 2
+
+
+class CachedSkillUserViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.SkillUserSerializer)
+
+
+class ConditionalSkillUserViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.SkillUserSerializer)
+
+
+class ConditionalSkillViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Skill.objects.all()
+    serializer_class = serializer_factory(serializers.SkillSerializer)
+
+
+class ConditionalSkillUserPaginatedViewSet(ConditionalGetMixin, SkillUserPaginatedViewSet):
+    pass
+
+
 class GroupUserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = serializer_factory(serializers.GroupUserSerializer)
@@ -60,3 +132,28 @@ class GroupUserViewSet(viewsets.ModelViewSet):
 class SkillViewSet(viewsets.ModelViewSet):
     queryset = Skill.objects.all()
     serializer_class = serializer_factory(serializers.SkillSerializer)
+
+
+class AggressiveRetrieveSkillViewSet(AggressiveRetrieveMixin, viewsets.ModelViewSet):
+    queryset = Skill.objects.all()
+    serializer_class = serializer_factory(serializers.SkillSerializer)
+
+
+class SkillStatsUserViewSet(viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.SkillStatsUserSerializer)
+
+
+class MagicSkillUserViewSet(viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.MagicSkillUserSerializer)
+
+
+class SkillStatsGroupViewSet(viewsets.ModelViewSet):
+    queryset = Group.objects.all()
+    serializer_class = serializer_factory(serializers.SkillStatsGroupSerializer)
+
+
+class ExplainSkillUserViewSet(ExplainMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = serializer_factory(serializers.SkillUserSerializer)
@@ -18,7 +18,7 @@ except IOError:
 install_requires = [
     'django >= 1.9',
     'djangorestframework',
-    'django-aggressivequery'
+    'django-aggressivequery >= 0.3.2, < 0.4',  # NestedPrefetchOptimizer depends on its internals
 ]
 
 